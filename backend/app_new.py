@@ -6,6 +6,7 @@ import os
 # Import configuration and database
 from config import ALLOWED_ORIGINS, SECRET_KEY, UPLOAD_FOLDER, MAX_FILE_SIZE
 from database import create_database_indexes, create_upload_directory
+from engine_pool import engine_pool
 
 # Import route blueprints
 from routes.auth import auth_bp
@@ -19,9 +20,11 @@ from routes.newsletter import newsletter_bp
 # Import WebSocket handlers
 from websocket_handlers import (
     handle_connect, handle_disconnect, handle_user_login,
-    handle_join_chat_room, handle_leave_chat_room, handle_typing,
+    handle_join_chat_room, handle_leave_chat_room, handle_typing, handle_play_move,
+    handle_create_game, handle_join_game, handle_game_move, handle_resign,
+    handle_join_queue, handle_leave_queue,
     emit_new_message, emit_message_read, emit_notification,
-    start_cleanup_thread
+    start_cleanup_thread, start_multiplayer_tasks
 )
 
 app = Flask(__name__)
@@ -93,6 +96,34 @@ def on_leave_chat_room(data):
 def on_typing(data):
     handle_typing(socketio, data)
 
+@socketio.on('play_move')
+def on_play_move(data):
+    handle_play_move(socketio, data)
+
+@socketio.on('create_game')
+def on_create_game(data):
+    handle_create_game(socketio, data)
+
+@socketio.on('join_game')
+def on_join_game(data):
+    handle_join_game(socketio, data)
+
+@socketio.on('game_move')
+def on_game_move(data):
+    handle_game_move(socketio, data)
+
+@socketio.on('resign')
+def on_resign(data):
+    handle_resign(socketio, data)
+
+@socketio.on('join_queue')
+def on_join_queue(data):
+    handle_join_queue(socketio, data)
+
+@socketio.on('leave_queue')
+def on_leave_queue(data=None):
+    handle_leave_queue(socketio, data)
+
 # Update WebSocket handler functions to use the socketio instance
 def emit_new_message_wrapper(room_id, message_data):
     """Wrapper to emit new message with socketio instance"""
@@ -131,6 +162,12 @@ if __name__ == '__main__':
         # Start cleanup thread
         start_cleanup_thread(socketio)
         
+        # Multiplayer clocks and batched move persistence
+        start_multiplayer_tasks(socketio)
+        
+        # Start engine worker processes before serving requests
+        engine_pool.start()
+        
         print("Database indexes created successfully")
     except Exception as e:
         print(f"Error during initialization: {e}")
@@ -139,7 +176,7 @@ if __name__ == '__main__':
     print("Available endpoints:")
     print("- Authentication: /api/signup, /api/login, /api/google-auth")
     print("- Profile: /api/profile, /api/update-profile, /api/upload-profile-photo")
-    print("- Chess: /api/make-move, /api/ai-move")
+    print("- Chess: /api/new-game, /api/make-move, /api/ai-move, /api/play-move, /api/analyze")
     print("- Chat: /api/chat/*")
     print("- Settings: /api/change-password, /api/delete-account, /api/privacy-settings")
     print("- Data: /api/export-game-data, /api/game-history")
@@ -0,0 +1,260 @@
+"""Engine benchmarks: perft and fixed-depth EPD searches, reported as JSON.
+
+Runs without the database or network:
+
+    python benchmark.py --depth 3 --perft-depth 3 --output bench.json
+
+With --reference the same positions are also searched by a UCI engine
+(for example "stockfish" or "python uci.py") to the same depth. With
+--review-plies a random game of that length is reviewed through the engine
+pool, checking that the review finishes within its time budget.
+"""
+import argparse
+import json
+import random
+import shlex
+import sys
+import time
+import chess
+import chess.engine
+from chess_ai import ChessAI, TranspositionTable
+
+# Standard perft positions with known node counts for depths 1-4
+PERFT_POSITIONS = [
+    {
+        'name': 'startpos',
+        'fen': chess.STARTING_FEN,
+        'nodes': [20, 400, 8902, 197281],
+    },
+    {
+        'name': 'kiwipete',
+        'fen': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+        'nodes': [48, 2039, 97862, 4085603],
+    },
+    {
+        'name': 'position3',
+        'fen': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+        'nodes': [14, 191, 2812, 43238],
+    },
+    {
+        'name': 'position4',
+        'fen': 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+        'nodes': [6, 264, 9467, 422333],
+    },
+    {
+        'name': 'position5',
+        'fen': 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+        'nodes': [44, 1486, 62379, 2103487],
+    },
+]
+
+# Win at Chess tactical positions
+DEFAULT_EPD = [
+    '2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - bm Qg6; id "WAC.001";',
+    '8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/8 b - - bm Rxb2; id "WAC.002";',
+    '5rk1/1ppb3p/p1pb4/6q1/3P1p1r/2P1R2P/PP1BQ1P1/5RKN w - - bm Rg3; id "WAC.003";',
+    'r1bq2rk/pp3pbp/2p1p1pQ/7P/3P4/2PB1N2/PP3PPR/2KR4 w - - bm Qxh7+; id "WAC.004";',
+    '5k2/6pp/p1qN4/1p1p4/3P4/2PKP2Q/PP3r2/3R4 b - - bm Qc4+; id "WAC.005";',
+    '7k/p7/1R5K/6r1/6p1/6P1/8/8 w - - bm Rb7; id "WAC.006";',
+    'rnbqkb1r/pppp1ppp/8/4P3/6n1/7P/PPPNPPP1/R1BQKBNR b KQkq - bm Ne3; id "WAC.007";',
+    'r4q1k/p2bR1rp/2p2Q1N/5p2/5p2/2P5/PP3PPP/R5K1 w - - bm Rf7; id "WAC.008";',
+    '3q1rk1/p4pp1/2pb3p/3p4/6Pr/1PNQ4/P1PB1PP1/4RRK1 b - - bm Bh2+; id "WAC.009";',
+    '2br2k1/2q3rn/p2NppQ1/2p1P3/Pp5R/4P3/1P3PPP/3R2K1 w - - bm Rh7; id "WAC.010";',
+]
+
+def perft(board, depth):
+    """Count leaf nodes of the legal move tree"""
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+def run_perft(max_depth):
+    results = []
+    for position in PERFT_POSITIONS:
+        board = chess.Board(position['fen'])
+        for depth in range(1, max_depth + 1):
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            expected = position['nodes'][depth - 1] if depth <= len(position['nodes']) else None
+            results.append({
+                'name': position['name'],
+                'depth': depth,
+                'nodes': nodes,
+                'expected': expected,
+                'ok': expected is None or nodes == expected,
+                'seconds': round(elapsed, 4),
+                'nps': int(nodes / elapsed) if elapsed > 0 else None,
+            })
+    return results
+
+def run_search(epd_lines, depth, time_budget_ms):
+    results = []
+    for line in epd_lines:
+        board, ops = chess.Board.from_epd(line)
+        best_moves = ops.get('bm', [])
+
+        # Fresh table and no book/tablebase so every run measures the search alone
+        ai = ChessAI(5, transposition_table=TranspositionTable())
+        ai.use_book = False
+        ai.tablebase = None
+
+        start = time.perf_counter()
+        move = ai.get_best_move(board, time_budget_ms, max_depth=depth)
+        elapsed = time.perf_counter() - start
+
+        # Effective branching factor: nodes of the last iteration over the one before
+        per_iteration = [
+            total - previous for previous, total in zip([0] + ai.iteration_nodes, ai.iteration_nodes)
+        ]
+        branching = None
+        if len(per_iteration) >= 2 and per_iteration[-2] > 0:
+            branching = round(per_iteration[-1] / per_iteration[-2], 2)
+
+        results.append({
+            'id': ops.get('id'),
+            'fen': board.fen(),
+            'depth': ai.completed_depth,
+            'move': move.uci() if move else None,
+            'expected': [m.uci() for m in best_moves],
+            'solved': move in best_moves if best_moves else None,
+            'nodes': ai.nodes,
+            'seconds': round(elapsed, 4),
+            'nps': int(ai.nodes / elapsed) if elapsed > 0 else None,
+            'branching_factor': branching,
+            'beta_cutoffs': ai.beta_cutoffs,
+            'first_move_cutoffs': ai.first_move_cutoffs,
+            'first_move_cutoff_rate': round(ai.first_move_cutoffs / ai.beta_cutoffs, 3) if ai.beta_cutoffs else None,
+        })
+    return results
+
+def run_reference(command, epd_lines, depth, time_budget_ms):
+    """Search the EPD positions with an external UCI engine for comparison"""
+    results = []
+    engine = chess.engine.SimpleEngine.popen_uci(shlex.split(command))
+    try:
+        for line in epd_lines:
+            board, ops = chess.Board.from_epd(line)
+            best_moves = ops.get('bm', [])
+            limit = chess.engine.Limit(depth=depth, time=time_budget_ms / 1000.0)
+
+            start = time.perf_counter()
+            result = engine.play(board, limit, info=chess.engine.INFO_BASIC)
+            elapsed = time.perf_counter() - start
+
+            nodes = result.info.get('nodes', 0)
+            results.append({
+                'id': ops.get('id'),
+                'depth': result.info.get('depth'),
+                'move': result.move.uci() if result.move else None,
+                'solved': result.move in best_moves if best_moves else None,
+                'nodes': nodes,
+                'seconds': round(elapsed, 4),
+                'nps': int(nodes / elapsed) if elapsed > 0 else None,
+            })
+    finally:
+        engine.quit()
+    return results
+
+def run_review(plies, seed):
+    """Review a random game through the engine pool, as /api/review-game does"""
+    from engine_pool import engine_pool, EngineTimeout
+    from game_review import review_moves
+
+    rng = random.Random(seed)
+    board = chess.Board()
+    moves = []
+    while len(moves) < plies and not board.is_game_over():
+        move = rng.choice(list(board.legal_moves))
+        board.push(move)
+        moves.append(move)
+
+    start = time.perf_counter()
+    try:
+        review = review_moves(moves)
+        result = {'ok': True, 'error': None, 'depth': review['depth']}
+    except EngineTimeout as e:
+        result = {'ok': False, 'error': str(e), 'depth': None}
+    finally:
+        engine_pool.stop()
+    result.update({'plies': len(moves), 'seconds': round(time.perf_counter() - start, 4)})
+    return result
+
+def summarize(perft_results, search_results):
+    total_nodes = sum(r['nodes'] for r in search_results)
+    total_seconds = sum(r['seconds'] for r in search_results)
+    total_cutoffs = sum(r['beta_cutoffs'] for r in search_results)
+    first_move_cutoffs = sum(r['first_move_cutoffs'] for r in search_results)
+    branching = [r['branching_factor'] for r in search_results if r['branching_factor'] is not None]
+    return {
+        'perft_ok': all(r['ok'] for r in perft_results),
+        'perft_nps': int(
+            sum(r['nodes'] for r in perft_results) / sum(r['seconds'] for r in perft_results)
+        ) if perft_results and sum(r['seconds'] for r in perft_results) > 0 else None,
+        'positions': len(search_results),
+        'solved': sum(1 for r in search_results if r['solved']),
+        'search_nodes': total_nodes,
+        'search_seconds': round(total_seconds, 4),
+        'search_nps': int(total_nodes / total_seconds) if total_seconds > 0 else None,
+        'mean_branching_factor': round(sum(branching) / len(branching), 2) if branching else None,
+        'first_move_cutoff_rate': round(first_move_cutoffs / total_cutoffs, 3) if total_cutoffs else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the ChessAI engine')
+    parser.add_argument('--depth', type=int, default=3, help='fixed search depth for EPD positions')
+    parser.add_argument('--time-budget-ms', type=int, default=600000, help='safety limit per search')
+    parser.add_argument('--perft-depth', type=int, default=3, help='maximum perft depth (0 to skip)')
+    parser.add_argument('--epd', help='EPD file to search instead of the built-in tactics')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for reproducible runs')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--reference', help='UCI engine command to search the same positions for comparison')
+    parser.add_argument('--review-plies', type=int, default=0, help='review a random game of this many plies (0 to skip)')
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+
+    epd_lines = DEFAULT_EPD
+    if args.epd:
+        with open(args.epd) as f:
+            epd_lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    perft_results = run_perft(args.perft_depth) if args.perft_depth > 0 else []
+    search_results = run_search(epd_lines, args.depth, args.time_budget_ms)
+
+    report = {
+        'python_chess': chess.__version__,
+        'settings': {'depth': args.depth, 'perft_depth': args.perft_depth, 'seed': args.seed},
+        'summary': summarize(perft_results, search_results),
+        'perft': perft_results,
+        'search': search_results,
+    }
+    if args.reference:
+        reference_results = run_reference(args.reference, epd_lines, args.depth, args.time_budget_ms)
+        report['reference'] = {
+            'engine': args.reference,
+            'solved': sum(1 for r in reference_results if r['solved']),
+            'nodes': sum(r['nodes'] for r in reference_results),
+            'seconds': round(sum(r['seconds'] for r in reference_results), 4),
+            'search': reference_results,
+        }
+
+    if args.review_plies > 0:
+        report['review'] = run_review(args.review_plies, args.seed)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    review_ok = report.get('review', {'ok': True})['ok']
+    return 0 if report['summary']['perft_ok'] and review_ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,154 +1,1062 @@
 import chess
+import chess.polyglot
+import chess.syzygy
+import os
 import random
-from config import DEFAULT_AI_DIFFICULTY, MAX_AI_SEARCH_DEPTH
+import time
+from array import array
+from config import (
+    DEFAULT_AI_DIFFICULTY, MAX_AI_SEARCH_DEPTH, AI_DIFFICULTY_LEVELS, AI_TRANSPOSITION_TABLE_SIZE, AI_MOVE_TIME_MS,
+    AI_ANALYSIS_MAX_DEPTH, AI_OPENING_BOOK_PATH, AI_SYZYGY_PATH, AI_SYZYGY_MAX_PIECES, AI_SYZYGY_CACHE_SIZE
+)
+from collections import OrderedDict
+from move_codec import encode_move, decode_move
 
-class ChessAI:
-    def __init__(self, difficulty=DEFAULT_AI_DIFFICULTY):
-        self.difficulty = max(1, min(5, difficulty))
-        self.piece_values = {
-            chess.PAWN: 100,
-            chess.KNIGHT: 320,
-            chess.BISHOP: 330,
-            chess.ROOK: 500,
-            chess.QUEEN: 900,
-            chess.KING: 20000,
-        }
+# Tablebase wins rank below real mates found by the search
+TB_WIN_SCORE = 9000
+
+MATE_SCORE = 10000
+MAX_PLY = 128
+
+# Search pruning and reduction parameters
+ASPIRATION_WINDOW = 50
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVE_INDEX = 3
+
+# Nodes between clock checks; short budgets check more often so they aren't overrun
+NODE_POLL_INTERVAL = 1024
+MIN_NODE_POLL_INTERVAL = 16
+
+# Butterfly history table: one counter per from/to square pair and colour
+HISTORY_SIZE = 64 * 64
+HISTORY_MAX = 30000  # stays below killer and capture ordering scores
+
+# Transposition table bound types
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+
+def node_poll_mask(time_budget_ms):
+    """Mask for count_node: about one clock check per half millisecond of budget, at most every 1024 nodes"""
+    interval = MIN_NODE_POLL_INTERVAL
+    while interval < NODE_POLL_INTERVAL and interval < time_budget_ms * 2:
+        interval *= 2
+    return interval - 1
+
+def score_to_tt(score, ply):
+    """Store mate scores as distance from this node rather than from the root"""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+class TranspositionTable:
+    """Fixed-size Zobrist-keyed table of previously searched positions"""
+
+    def __init__(self, size=AI_TRANSPOSITION_TABLE_SIZE):
+        self.size = size
+        self.entries = [None] * size  # (key, depth, bound, score, move, age)
+        self.age = 0
+        self.used = 0
+
+    def new_search(self):
+        """Start a new search so entries from older searches can be replaced"""
+        self.age += 1
+
+    def probe(self, key):
+        """Return the entry stored for key, or None"""
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """Store a search result, preferring deeper and more recent entries"""
+        index = key % self.size
+        existing = self.entries[index]
+        if existing is None:
+            self.used += 1
+        elif existing[0] == key:
+            # Keep the old best move if this search didn't find one
+            if move is None:
+                move = existing[4]
+        elif existing[5] == self.age and existing[1] > depth:
+            return
+        self.entries[index] = (key, depth, bound, score, move, self.age)
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.age = 0
+        self.used = 0
+
+    def __len__(self):
+        return self.used
+
+class SharedTranspositionTable:
+    """Transposition table in a shared buffer of 64-bit words, for Lazy SMP helpers.
 
-        # Simplified position tables for faster evaluation
-        self.pawn_table = [
-            0, 0, 0, 0, 0, 0, 0, 0,
-            50, 50, 50, 50, 50, 50, 50, 50,
-            10, 10, 20, 30, 30, 20, 10, 10,
-            5, 5, 10, 25, 25, 10, 5, 5,
-            0, 0, 0, 20, 20, 0, 0, 0,
-            5, -5, -10, 0, 0, -10, -5, 5,
-            5, 10, 10, -20, -20, 10, 10, 5,
-            0, 0, 0, 0, 0, 0, 0, 0
+    Each entry is two words: the key XORed with the data word, and the data word
+    itself. Processes write without locks; a torn write fails the XOR check and
+    reads as a miss. The first two words hold the search age.
+    """
+
+    SCORE_OFFSET = 1 << 19
+
+    def __init__(self, buffer, owner=True):
+        self.words = memoryview(buffer).cast('B').cast('Q')
+        self.size = (len(self.words) - 2) // 2
+        self.owner = owner  # only the main search process advances the age
+        self.used = 0
+
+    @staticmethod
+    def words_for(size):
+        """Number of 64-bit words a table with this many entries needs"""
+        return 2 + 2 * size
+
+    @property
+    def age(self):
+        return self.words[0]
+
+    def new_search(self):
+        if self.owner:
+            self.words[0] = (self.words[0] + 1) & 0xFF
+
+    def probe(self, key):
+        index = 2 + 2 * (key % self.size)
+        data = self.words[index + 1]
+        if not data or self.words[index] ^ data != key:
+            return None
+        code = data >> 38
+        move = decode_move(code) if code else None
+        score = (data & 0xFFFFF) - self.SCORE_OFFSET
+        return (key, data >> 20 & 0xFF, data >> 28 & 3, score, move, data >> 30 & 0xFF)
+
+    def store(self, key, depth, bound, score, move):
+        index = 2 + 2 * (key % self.size)
+        existing = self.words[index + 1]
+        age = self.words[0]
+        if existing:
+            if self.words[index] ^ existing == key:
+                if move is None:
+                    move_code = existing >> 38
+                    move = decode_move(move_code) if move_code else None
+            elif existing >> 30 & 0xFF == age and existing >> 20 & 0xFF > depth:
+                return
+        else:
+            self.used += 1
+        
+        data = (
+            (int(score) + self.SCORE_OFFSET) & 0xFFFFF
+            | min(max(depth, 0), 255) << 20
+            | bound << 28
+            | age << 30
+            | (encode_move(move) if move else 0) << 38
+        )
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+
+    def clear(self):
+        self.words[:] = bytes(len(self.words) * 8)
+        self.used = 0
+
+    def __len__(self):
+        return self.used
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 320,
+    chess.BISHOP: 330,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 20000,
+}
+
+# Piece-square tables from white's side, rank 8 first (index = square_mirror for white)
+PIECE_SQUARE_TABLES = {
+    chess.PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0
+    ],
+    chess.KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50
+    ],
+    chess.BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20
+    ],
+    chess.ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0
+    ],
+    chess.QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20
+    ],
+    chess.KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20
+    ],
+}
+
+KING_ENDGAME_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50
+]
+
+# Piece value plus piece-square bonus for every (color, piece type, square),
+# signed from black's side like the rest of the evaluation
+SQUARE_VALUES = {
+    color: {
+        piece_type: [
+            (1 if color == chess.BLACK else -1) * (
+                PIECE_VALUES[piece_type]
+                + table[chess.square_mirror(square) if color == chess.WHITE else square]
+            )
+            for square in chess.SQUARES
         ]
+        for piece_type, table in PIECE_SQUARE_TABLES.items()
+    }
+    for color in chess.COLORS
+}
 
-    def get_position_value(self, piece, square):
-        """Simplified position evaluation"""
-        if piece.piece_type == chess.PAWN:
-            index = square if piece.color == chess.WHITE else 63 - square
-            return self.pawn_table[index]
-        elif piece.piece_type in [chess.KNIGHT, chess.BISHOP]:
-            # Prefer center squares
-            file, rank = chess.square_file(square), chess.square_rank(square)
-            center_bonus = 10 if 2 <= file <= 5 and 2 <= rank <= 5 else 0
-            return center_bonus
-        return 0
-
-    def evaluate_position(self, board):
-        """Fast position evaluation"""
-        if board.is_checkmate():
-            return -10000 if board.turn == chess.BLACK else 10000
-        
-        if board.is_stalemate() or board.is_insufficient_material():
-            return 0
+MOBILITY_WEIGHT = 5  # centipawns per attacked square
+
+# Least valuable attacker first, for static exchange evaluation
+PIECE_ORDER = (chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING)
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the move time budget runs out"""
+    pass
+
+# Shared by every ChessAI in this worker so results carry over between requests
+shared_transposition_table = TranspositionTable()
+
+_opening_book = None
+_opening_book_loaded = False
+
+def get_opening_book():
+    """Open the Polyglot book once per process; the reader memory-maps the file"""
+    global _opening_book, _opening_book_loaded
+    if not _opening_book_loaded:
+        _opening_book_loaded = True
+        if AI_OPENING_BOOK_PATH and os.path.isfile(AI_OPENING_BOOK_PATH):
+            try:
+                _opening_book = chess.polyglot.open_reader(AI_OPENING_BOOK_PATH)
+            except Exception as e:
+                print(f"Error opening book {AI_OPENING_BOOK_PATH}: {e}")
+    return _opening_book
+
+class ProbeCache:
+    """Small LRU of tablebase probe results keyed by Zobrist hash"""
+
+    def __init__(self, size=AI_SYZYGY_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+_tablebase = None
+_tablebase_loaded = False
+tablebase_cache = ProbeCache()
+
+def get_tablebase():
+    """Open the local Syzygy tables once per process, or return None if not configured"""
+    global _tablebase, _tablebase_loaded
+    if not _tablebase_loaded:
+        _tablebase_loaded = True
+        if AI_SYZYGY_PATH and os.path.isdir(AI_SYZYGY_PATH):
+            try:
+                _tablebase = chess.syzygy.open_tablebase(AI_SYZYGY_PATH)
+            except Exception as e:
+                print(f"Error opening Syzygy tables {AI_SYZYGY_PATH}: {e}")
+    return _tablebase
+
+class ChessAI:
+    def __init__(self, difficulty=DEFAULT_AI_DIFFICULTY, transposition_table=None):
+        self.difficulty = max(1, min(5, difficulty))
+        self.tt = transposition_table if transposition_table is not None else shared_transposition_table
+        self.tablebase = get_tablebase()
+        self.deadline = None
+        self.node_limit = None
+        self.poll_mask = NODE_POLL_INTERVAL - 1
+        self.stop_flag = None  # optional shared flag (anything with .value) to abort the search
+        self.use_book = True
+        self.helper_index = 0  # Lazy SMP helpers (> 0) vary depth and root order to fill a shared table
+        self.on_iteration = None  # optional callback(ai) after each finished iteration, e.g. for UCI info
+        self.start_time = 0
+        self.reset_stats()
+        self.pv = []
+        self.root_lines = []  # (move, score) of the top root moves from the last iteration
+        self.piece_values = PIECE_VALUES
+        self.material = 0
+        self.material_stack = []
         
+        # Quiet move ordering: two killer slots per ply (encoded moves, second slot
+        # at ply + MAX_PLY) and a from/to history table per colour
+        self.killers = array('i', [-1]) * (2 * MAX_PLY)
+        self.history = array('i', [0]) * (2 * HISTORY_SIZE)
+
+    def material_score(self, board):
+        """Material plus piece-square score, computed from the piece bitboards"""
         score = 0
-        
-        # Material and basic positional evaluation
-        for square in chess.SQUARES:
-            piece = board.piece_at(square)
-            if piece:
-                piece_value = self.piece_values.get(piece.piece_type, 0)
-                position_value = self.get_position_value(piece, square)
-                total_value = piece_value + position_value
-                
-                if piece.color == chess.BLACK:
-                    score += total_value
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                values = SQUARE_VALUES[color][piece_type]
+                for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                    score += values[square]
+        return score
+
+    def push(self, board, move):
+        """Make a move, updating the material/PST score incrementally"""
+        self.material_stack.append(self.material)
+        if move:
+            color = board.turn
+            piece_type = board.piece_type_at(move.from_square)
+            own_values = SQUARE_VALUES[color]
+            delta = own_values[move.promotion or piece_type][move.to_square] - own_values[piece_type][move.from_square]
+            
+            if board.is_castling(move):
+                rank = chess.square_rank(move.from_square)
+                if board.is_kingside_castling(move):
+                    rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
                 else:
-                    score -= total_value
+                    rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+                delta += own_values[chess.ROOK][rook_to] - own_values[chess.ROOK][rook_from]
+            elif board.is_en_passant(move):
+                captured_square = move.to_square + (-8 if color == chess.WHITE else 8)
+                delta -= SQUARE_VALUES[not color][chess.PAWN][captured_square]
+            else:
+                captured_type = board.piece_type_at(move.to_square)
+                if captured_type:
+                    delta -= SQUARE_VALUES[not color][captured_type][move.to_square]
+            self.material += delta
+        board.push(move)
+
+    def pop(self, board):
+        """Take back a move made with push"""
+        self.material = self.material_stack.pop()
+        return board.pop()
+
+    def static_eval(self, board, material):
+        """Leaf evaluation from bitboards: material/PST score plus king safety and mobility"""
+        score = material
+        queens = board.queens
+        
+        # Kings should head for the centre once the heavy pieces are gone
+        if not queens or chess.popcount(board.occupied) - chess.popcount(board.pawns) <= 6:
+            for color in chess.COLORS:
+                king_square = board.king(color)
+                if king_square is not None:
+                    index = chess.square_mirror(king_square) if color == chess.WHITE else king_square
+                    correction = KING_ENDGAME_TABLE[index] - PIECE_SQUARE_TABLES[chess.KING][index]
+                    score += correction if color == chess.BLACK else -correction
         
-        # Mobility bonus (simplified)
-        mobility_bonus = len(list(board.legal_moves)) * 5
-        score += mobility_bonus if board.turn == chess.BLACK else -mobility_bonus
+        # Pseudo-legal mobility of the minor and major pieces from attack masks
+        sliders_and_knights = board.knights | board.bishops | board.rooks | queens
+        for color in chess.COLORS:
+            own = board.occupied_co[color]
+            mobility = 0
+            for square in chess.scan_forward(sliders_and_knights & own):
+                mobility += chess.popcount(board.attacks_mask(square) & ~own)
+            score += mobility * MOBILITY_WEIGHT if color == chess.BLACK else -mobility * MOBILITY_WEIGHT
         
         return score
 
-    def minimax(self, board, depth, alpha, beta, maximizing_player):
-        """Optimized minimax with reduced depth for faster play"""
-        if depth == 0 or board.is_game_over():
-            return self.evaluate_position(board)
+    def count_node(self):
+        """Count a searched node and check the limits and stop flag every poll_mask + 1 nodes"""
+        self.nodes += 1
+        if self.nodes & self.poll_mask == 0:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                raise SearchTimeout()
+            # The node budget never cuts the first iteration short, so there is always a move
+            if self.node_limit is not None and self.nodes >= self.node_limit and self.completed_depth:
+                raise SearchTimeout()
+            if self.stop_flag is not None and self.stop_flag.value:
+                raise SearchTimeout()
+
+    def count_cutoff(self, move_index):
+        """Record a cutoff and whether the first move ordered produced it"""
+        self.beta_cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+
+    def static_exchange(self, board, move):
+        """Material balance of the capture sequence started by move on its target square"""
+        to_square = move.to_square
+        occupied = board.occupied & ~chess.BB_SQUARES[move.from_square]
+        if board.is_en_passant(move):
+            captured_value = self.piece_values[chess.PAWN]
+            occupied &= ~chess.BB_SQUARES[to_square + (-8 if board.turn == chess.WHITE else 8)]
+        else:
+            captured_type = board.piece_type_at(to_square)
+            captured_value = self.piece_values[captured_type] if captured_type else 0
         
-        moves = list(board.legal_moves)
+        gain = [captured_value]
+        victim_value = self.piece_values[move.promotion or board.piece_type_at(move.from_square)]
+        side = not board.turn
+        
+        # Both sides recapture with their least valuable attacker
+        while True:
+            attackers = board.attackers_mask(side, to_square, occupied) & occupied
+            if not attackers:
+                break
+            for piece_type in PIECE_ORDER:
+                candidates = attackers & board.pieces_mask(piece_type, side)
+                if candidates:
+                    break
+            gain.append(victim_value - gain[-1])
+            occupied &= ~chess.BB_SQUARES[chess.lsb(candidates)]
+            victim_value = self.piece_values[piece_type]
+            side = not side
+        
+        # Either side may stop recapturing when it would lose material
+        while len(gain) > 1:
+            last = gain.pop()
+            gain[-1] = -max(-gain[-1], last)
+        return gain[0]
+
+    def order_moves(self, board, moves, tt_move=None, ply=None):
+        """Sort moves in one pass: TT move, winning/equal captures by MVV-LVA, promotions,
+        killer moves, other quiet moves by history score, then losing captures"""
+        them = board.occupied_co[not board.turn]
+        ep_square = board.ep_square
+        piece_type_at = board.piece_type_at
+        piece_values = self.piece_values
+        history = self.history
+        history_offset = HISTORY_SIZE if board.turn == chess.BLACK else 0
+        killer_1, killer_2 = (self.killers[ply], self.killers[ply + MAX_PLY]) if ply is not None else (-1, -1)
         
-        # Move ordering for better pruning (captures first)
-        def move_priority(move):
-            if board.is_capture(move):
-                return 1000
+        scored = []
+        for move in moves:
+            from_square = move.from_square
+            to_square = move.to_square
+            if move == tt_move:
+                score = 1000000
+            elif them & chess.BB_SQUARES[to_square] or (
+                    to_square == ep_square and piece_type_at(from_square) == chess.PAWN):
+                victim_type = piece_type_at(to_square) or chess.PAWN
+                victim_value = piece_values[victim_type]
+                attacker_value = piece_values[piece_type_at(from_square)]
+                mvv_lva = 10 * victim_value - attacker_value
+                if victim_value >= attacker_value or self.static_exchange(board, move) >= 0:
+                    score = 100000 + mvv_lva
+                else:
+                    score = -100000 + mvv_lva
+            elif move.promotion:
+                score = 50000 + piece_values[move.promotion]
+            else:
+                code = encode_move(move)
+                if code == killer_1:
+                    score = 40000
+                elif code == killer_2:
+                    score = 39000
+                else:
+                    score = history[history_offset + (from_square << 6 | to_square)]
+            scored.append((score, move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for _, move in scored]
+
+    def good_captures(self, board):
+        """Legal captures that don't lose material, by MVV-LVA; SEE only runs when the victim is cheaper"""
+        piece_type_at = board.piece_type_at
+        piece_values = self.piece_values
+        scored = []
+        for move in board.generate_legal_captures():
+            victim_value = piece_values[piece_type_at(move.to_square) or chess.PAWN]
+            attacker_value = piece_values[piece_type_at(move.from_square)]
+            if victim_value >= attacker_value or self.static_exchange(board, move) >= 0:
+                scored.append((10 * victim_value - attacker_value, move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for _, move in scored]
+
+    def update_quiet_cutoff(self, board, move, depth, ply):
+        """Remember a quiet move that caused a cutoff as a killer and in the history table"""
+        code = encode_move(move)
+        if self.killers[ply] != code:
+            self.killers[ply + MAX_PLY] = self.killers[ply]
+            self.killers[ply] = code
+        
+        index = (HISTORY_SIZE if board.turn == chess.BLACK else 0) + (move.from_square << 6 | move.to_square)
+        self.history[index] = min(self.history[index] + depth * depth, HISTORY_MAX)
+
+    def new_search_tables(self):
+        """Clear killers and age the history table before a new search"""
+        self.killers = array('i', [-1]) * (2 * MAX_PLY)
+        history = self.history
+        for index in range(len(history)):
+            history[index] >>= 1
+
+    def relative_eval(self, board):
+        """Static evaluation from the side to move's point of view"""
+        score = self.static_eval(board, self.material)
+        return score if board.turn == chess.BLACK else -score
+
+    def quiescence(self, board, alpha, beta, ply):
+        """Resolve captures at the search horizon so leaves are evaluated in quiet positions"""
+        self.count_node()
+        self.qnodes += 1
+        
+        if board.is_check():
+            # No standing pat in check: every evasion has to be looked at
+            moves = list(board.legal_moves)
+            if not moves:
+                return -MATE_SCORE + ply
+            moves = self.order_moves(board, moves)
+            best_score = float('-inf')
+        else:
+            stand_pat = self.relative_eval(board)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            best_score = stand_pat
+            
+            # Only captures and promotions that don't lose material
+            moves = self.good_captures(board)
+            promoting = board.pawns & board.occupied_co[board.turn] & (
+                chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2)
+            if promoting:
+                moves.extend(
+                    move for move in board.generate_legal_moves(promoting, chess.BB_ALL & ~board.occupied)
+                    if move.promotion == chess.QUEEN
+                )
+        
+        for move in moves:
+            self.push(board, move)
+            score = -self.quiescence(board, -beta, -alpha, ply + 1)
+            self.pop(board)
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        
+        return best_score
+
+    def negamax(self, board, depth, alpha, beta, ply, allow_null=True):
+        """Principal variation search with null-move pruning and late-move reductions"""
+        if depth <= 0:
+            return self.quiescence(board, alpha, beta, ply)
+        
+        self.count_node()
+        
+        if board.is_insufficient_material() or board.is_repetition(3):
             return 0
         
-        moves.sort(key=move_priority, reverse=True)
+        pv_node = beta - alpha > 1
         
-        if maximizing_player:
-            max_eval = float('-inf')
-            for move in moves:
-                board.push(move)
-                eval_score = self.minimax(board, depth - 1, alpha, beta, False)
-                board.pop()
-                max_eval = max(max_eval, eval_score)
-                alpha = max(alpha, eval_score)
-                if beta <= alpha:
-                    break
-            return max_eval
+        # Transposition table lookup (only trusted for cutoffs outside the PV)
+        key = chess.polyglot.zobrist_hash(board)
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry is not None:
+            self.tt_hits += 1
+            _, entry_depth, bound, entry_score, tt_move, _ = entry
+            if entry_depth >= depth and not pv_node:
+                entry_score = score_from_tt(entry_score, ply)
+                if (bound == TT_EXACT
+                        or (bound == TT_LOWER and entry_score >= beta)
+                        or (bound == TT_UPPER and entry_score <= alpha)):
+                    return entry_score
+        
+        # Exact result for positions covered by the endgame tablebase
+        tablebase_score = self.probe_tablebase(board, key)
+        if tablebase_score is not None:
+            return tablebase_score
+        
+        in_check = board.is_check()
+        
+        # Null move: if passing still beats beta, a real move will too. Skipped in check
+        # and when only pawns are left, where zugzwang makes the assumption unsafe
+        if (allow_null and not pv_node and not in_check and depth >= NULL_MOVE_MIN_DEPTH
+                and board.occupied_co[board.turn] & ~(board.pawns | board.kings)
+                and self.relative_eval(board) >= beta):
+            reduction = NULL_MOVE_REDUCTION + (1 if depth >= 6 else 0)
+            self.push(board, chess.Move.null())
+            score = -self.negamax(board, depth - 1 - reduction, -beta, -beta + 1, ply + 1, False)
+            self.pop(board)
+            if score >= beta:
+                return beta if score >= MATE_SCORE - MAX_PLY else score
+        
+        alpha_orig = alpha
+        moves = self.order_moves(board, board.legal_moves, tt_move, ply)
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+        
+        best_score = float('-inf')
+        best_move = None
+        for index, move in enumerate(moves):
+            quiet = not board.is_capture(move) and not move.promotion
+            self.push(board, move)
+            
+            if index == 0:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                # Late quiet moves are searched shallower first
+                reduction = 0
+                if (depth >= LMR_MIN_DEPTH and index >= LMR_MIN_MOVE_INDEX and quiet
+                        and not in_check and not board.is_check()):
+                    reduction = 1 if index < 2 * LMR_MIN_MOVE_INDEX else 2
+                    reduction = min(reduction, depth - 2)
+                
+                # Null-window search, widened only when the move looks better than alpha
+                score = -self.negamax(board, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                if score > alpha and reduction:
+                    score = -self.negamax(board, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            
+            self.pop(board)
+            
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.count_cutoff(index)
+                if quiet:
+                    self.update_quiet_cutoff(board, move, depth, ply)
+                break
+        
+        if best_score <= alpha_orig:
+            bound = TT_UPPER
+        elif best_score >= beta:
+            bound = TT_LOWER
         else:
-            min_eval = float('inf')
-            for move in moves:
-                board.push(move)
-                eval_score = self.minimax(board, depth - 1, alpha, beta, True)
+            bound = TT_EXACT
+        self.tt.store(key, depth, bound, score_to_tt(best_score, ply), best_move)
+        
+        return best_score
+
+    def probe_tablebase(self, board, key):
+        """WDL score for the side to move in a small enough position, or None"""
+        if (self.tablebase is None or board.castling_rights
+                or chess.popcount(board.occupied) > AI_SYZYGY_MAX_PIECES):
+            return None
+        
+        wdl = tablebase_cache.get(key)
+        if wdl is None:
+            wdl = self.tablebase.get_wdl(board)
+            if wdl is None:
+                return None
+            tablebase_cache.put(key, wdl)
+        
+        # Cursed wins and blessed losses are draws under the fifty-move rule
+        return TB_WIN_SCORE if wdl == 2 else -TB_WIN_SCORE if wdl == -2 else 0
+
+    def get_tablebase_move(self, board):
+        """Pick the tablebase-best root move: best WDL, then mate, then fastest progress by DTZ"""
+        if (self.tablebase is None or board.castling_rights
+                or chess.popcount(board.occupied) > AI_SYZYGY_MAX_PIECES):
+            return None
+        
+        best_move = None
+        best_key = None
+        for move in board.legal_moves:
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                mate = board.is_checkmate()
+                if mate:
+                    wdl, dtz = -2, 0
+                else:
+                    wdl = self.tablebase.get_wdl(board)
+                    dtz = self.tablebase.get_dtz(board)
+            finally:
                 board.pop()
-                min_eval = min(min_eval, eval_score)
-                beta = min(beta, eval_score)
-                if beta <= alpha:
-                    break
-            return min_eval
+            if wdl is None or dtz is None:
+                return None
+            
+            # The opponent's dtz is negative when they lose; closer to zero is faster.
+            # When losing, a larger dtz for the opponent means longer resistance.
+            # An immediate mate beats any other win, including a zeroing move.
+            our_wdl = -wdl
+            move_key = (our_wdl, mate, zeroing if our_wdl > 0 else False, dtz)
+            if best_key is None or move_key > best_key:
+                best_key = move_key
+                best_move = move
+        return best_move
+
+    def get_book_move(self, board):
+        """Pick a weighted random book move; higher difficulties favour the main lines"""
+        book = get_opening_book()
+        if book is None:
+            return None
+        
+        entries = [entry for entry in book.find_all(board) if entry.weight > 0]
+        if not entries:
+            return None
+        
+        # Weights are raised to a power of 1/3 at difficulty 1 up to 5/3 at difficulty 5
+        exponent = self.difficulty / 3.0
+        weights = [entry.weight ** exponent for entry in entries]
+        return random.choices(entries, weights=weights)[0].move
+
+    def principal_variation(self, board, max_length=None):
+        """Follow best moves stored in the transposition table from this position"""
+        pv = []
+        seen = set()
+        max_length = max_length or MAX_AI_SEARCH_DEPTH
+        while len(pv) < max_length:
+            key = chess.polyglot.zobrist_hash(board)
+            entry = self.tt.probe(key)
+            if entry is None or key in seen:
+                break
+            move = entry[4]
+            if move is None or not board.is_legal(move):
+                break
+            seen.add(key)
+            pv.append(move)
+            board.push(move)
+        for _ in pv:
+            board.pop()
+        return pv
 
-    def get_best_move(self, board):
-        """Get the best move with optimized search depth"""
+    def search_root(self, board, moves, depth, multipv=1, alpha=float('-inf'), beta=float('inf')):
+        """Search every root move to the given depth; returns the top (move, score) pairs, best first.
+
+        Up to multipv moves get exact scores. A first score at or above beta means the
+        aspiration window failed high and the move is only known to be at least that good.
+        """
+        lines = []
+        root_ply = board.ply()
+        
+        try:
+            for index, move in enumerate(moves):
+                # Only a move that beats the worst of the current top lines needs an exact score
+                lower = max(alpha, lines[-1][1]) if len(lines) == multipv else alpha
+                self.push(board, move)
+                if index == 0 or lower == float('-inf'):
+                    value = -self.negamax(board, depth - 1, -beta, -lower, 1)
+                else:
+                    value = -self.negamax(board, depth - 1, -lower - 1, -lower, 1)
+                    if lower < value < beta:
+                        value = -self.negamax(board, depth - 1, -beta, -lower, 1)
+                self.pop(board)
+                
+                if value >= beta:
+                    return [(move, value)]
+                
+                if len(lines) < multipv or value > lower:
+                    lines.append((move, value))
+                    lines.sort(key=lambda line: line[1], reverse=True)
+                    del lines[multipv:]
+        finally:
+            # A timeout or stop unwinds through negamax without popping: restore the caller's board
+            while board.ply() > root_ply:
+                self.pop(board)
+        
+        if lines[0][1] > alpha:
+            self.tt.store(chess.polyglot.zobrist_hash(board), depth, TT_EXACT, lines[0][1], lines[0][0])
+        return lines
+
+    def search_window(self, board, moves, depth, multipv, previous_score):
+        """Root search in an aspiration window around the previous score, widened on failure"""
+        if multipv > 1 or previous_score is None or depth < 2 or abs(previous_score) >= TB_WIN_SCORE:
+            return self.search_root(board, moves, depth, multipv)
+        
+        alpha, beta = previous_score - ASPIRATION_WINDOW, previous_score + ASPIRATION_WINDOW
+        while True:
+            lines = self.search_root(board, moves, depth, multipv, alpha, beta)
+            score = lines[0][1]
+            if score <= alpha:
+                alpha = float('-inf')
+            elif score >= beta:
+                beta = float('inf')
+            else:
+                return lines
+
+    @staticmethod
+    def choose_move(lines, max_loss):
+        """Pick among the top lines, giving up at most max_loss centipawns.
+
+        Weaker levels play a plausible second-best move instead of adding noise to
+        every score; moves closer to the best one are more likely.
+        """
+        best_score = lines[0][1]
+        candidates = [(move, score) for move, score in lines if best_score - score <= max_loss]
+        if len(candidates) == 1:
+            return candidates[0][0]
+        weights = [max_loss + 1 - (best_score - score) for _, score in candidates]
+        return random.choices(candidates, weights=weights)[0][0]
+
+    def reset_stats(self):
+        """Clear the per-search counters"""
+        self.nodes = 0
+        self.qnodes = 0
+        self.tt_hits = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.iteration_nodes = []  # total nodes after each completed iteration
+        self.completed_depth = 0
+        self.elapsed_ms = 0
+        self.move_source = None  # 'book', 'tablebase' or 'search'
+
+    def finish_stats(self, move_source):
+        """Record where the move came from and how long it took"""
+        self.move_source = move_source
+        self.elapsed_ms = (time.monotonic() - self.start_time) * 1000.0
+
+    def search_stats(self):
+        """Counters from the last get_best_move call"""
+        elapsed_seconds = self.elapsed_ms / 1000.0
+        return {
+            'difficulty': self.difficulty,
+            'source': self.move_source,
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'ttHits': self.tt_hits,
+            'betaCutoffs': self.beta_cutoffs,
+            'firstMoveCutoffs': self.first_move_cutoffs,
+            'depth': self.completed_depth,
+            'elapsedMs': round(self.elapsed_ms, 2),
+            'nps': int(self.nodes / elapsed_seconds) if elapsed_seconds > 0 else 0,
+            'pv': [move.uci() for move in self.pv],
+            'lines': [[move.uci(), score] for move, score in self.root_lines],
+        }
+
+    def start_search(self, board, time_budget_ms, node_limit=None):
+        """Reset the per-search state before iterative deepening"""
+        self.tt.new_search()
+        self.new_search_tables()
+        self.pv = []
+        self.root_lines = []
+        self.material = self.material_score(board)
+        self.material_stack = []
+        if time_budget_ms is None:
+            time_budget_ms = AI_MOVE_TIME_MS
+        self.deadline = time.monotonic() + time_budget_ms / 1000.0
+        self.poll_mask = node_poll_mask(time_budget_ms)
+        self.node_limit = node_limit
+
+    def iterative_deepening(self, board, moves, max_depth, multipv=1, first_depth=1):
+        """Search ever deeper, keeping the root lines of the deepest finished iteration"""
+        score = None
+        for depth in range(first_depth, max_depth + 1):
+            try:
+                lines = self.search_window(board, moves, depth, multipv, score)
+            except SearchTimeout:
+                break
+            score = lines[0][1]
+            self.root_lines = lines
+            self.completed_depth = depth
+            self.iteration_nodes.append(self.nodes)
+            self.pv = self.principal_variation(board, depth)
+            if self.on_iteration is not None:
+                self.on_iteration(self)
+            
+            # The previous iteration's top moves are searched first; deeper PV
+            # moves come back out of the transposition table inside negamax
+            for move, _ in reversed(lines):
+                moves.remove(move)
+                moves.insert(0, move)
+        
+        self.deadline = None
+        self.node_limit = None
+
+    def get_best_move(self, board, time_budget_ms=None, max_depth=None):
+        """Get the best move from the deepest search that fits in the time budget"""
         try:
             moves = list(board.legal_moves)
             if not moves:
                 return None
             
-            # Reduce search depth for faster play
-            search_depth = min(self.difficulty, MAX_AI_SEARCH_DEPTH)
+            self.reset_stats()
+            self.start_time = time.monotonic()
+            
+            # Known opening positions don't need a search
+            book_move = self.get_book_move(board) if self.use_book else None
+            if book_move is not None:
+                self.pv = [book_move]
+                self.finish_stats('book')
+                return book_move
             
-            best_move = None
-            best_value = float('-inf')
+            # Perfect play straight from the tablebase in simple endgames
+            tablebase_move = self.get_tablebase_move(board)
+            if tablebase_move is not None:
+                self.pv = [tablebase_move]
+                self.finish_stats('tablebase')
+                return tablebase_move
             
-            # Add randomness for lower difficulties
-            random_factor = (6 - self.difficulty) * 30
+            # Lower levels search less, so they are cheaper to serve as well as weaker
+            level = AI_DIFFICULTY_LEVELS[self.difficulty]
+            if time_budget_ms is None:
+                time_budget_ms = AI_MOVE_TIME_MS
+            if level['max_time_ms'] is not None:
+                time_budget_ms = min(time_budget_ms, level['max_time_ms'])
+            self.start_search(board, time_budget_ms, level['max_nodes'])
+            if max_depth is None:
+                max_depth = level['max_depth']
+            multipv = min(level['multipv'], len(moves))
             
             # Move ordering for better performance
-            def move_priority(move):
-                score = 0
-                if board.is_capture(move):
-                    captured_piece = board.piece_at(move.to_square)
-                    if captured_piece:
-                        score += self.piece_values.get(captured_piece.piece_type, 0)
-                if board.gives_check(move):
-                    score += 50
-                return score
-            
-            moves.sort(key=move_priority, reverse=True)
-            
-            for move in moves:
-                board.push(move)
-                value = self.minimax(board, search_depth - 1, float('-inf'), float('inf'), False)
-                board.pop()
-                
-                # Add randomness
-                if random_factor > 0:
-                    value += random.uniform(-random_factor, random_factor)
-                
-                if value > best_value:
-                    best_value = value
-                    best_move = move
+            moves = self.order_moves(board, moves)
+            
+            # Helpers diverge from the main search: odd ones start a ply deeper and
+            # every helper tries the non-PV root moves in a different order
+            first_depth = 1
+            if self.helper_index:
+                first_depth += self.helper_index % 2
+                max_depth += self.helper_index % 2
+                rest = moves[1:]
+                random.shuffle(rest)
+                moves[1:] = rest
             
+            self.iterative_deepening(board, moves, max_depth, multipv, first_depth)
+            if not self.root_lines:
+                best_move = moves[0]
+            elif len(self.root_lines) > 1:
+                best_move = self.choose_move(self.root_lines, level['max_loss'])
+                if best_move != self.root_lines[0][0]:
+                    board.push(best_move)
+                    self.pv = [best_move] + self.principal_variation(board, self.completed_depth - 1)
+                    board.pop()
+            else:
+                best_move = self.root_lines[0][0]
+            
+            self.finish_stats('search')
             return best_move
         except Exception as e:
             print(f"Error in get_best_move: {e}")
+            self.deadline = None
+            self.node_limit = None
             moves = list(board.legal_moves)
             return random.choice(moves) if moves else None
+
+    def analyze(self, board, multipv=1, time_budget_ms=None, max_depth=AI_ANALYSIS_MAX_DEPTH):
+        """Top lines of a position as dicts with the move, white's score and the PV (UCI)"""
+        moves = list(board.legal_moves)
+        self.reset_stats()
+        self.start_time = time.monotonic()
+        if not moves:
+            self.finish_stats('analysis')
+            return []
+        
+        self.start_search(board, time_budget_ms)
+        self.iterative_deepening(board, self.order_moves(board, moves), max_depth, min(multipv, len(moves)))
+        
+        lines = []
+        for move, score in self.root_lines:
+            board.push(move)
+            pv = [move] + self.principal_variation(board, self.completed_depth - 1)
+            board.pop()
+            
+            # Mate scores become moves to mate, positive when white mates
+            mate = None
+            if abs(score) >= MATE_SCORE - MAX_PLY:
+                mate = (MATE_SCORE - abs(score) + 1) // 2 * (1 if score > 0 else -1)
+            sign = 1 if board.turn == chess.WHITE else -1
+            lines.append({
+                'move': move.uci(),
+                'score': score * sign,
+                'mate': mate * sign if mate is not None else None,
+                'pv': [m.uci() for m in pv],
+            })
+        self.finish_stats('analysis')
+        return lines
+
+    def unsearched_result(self, board):
+        """Review result for a position without a search: game-over score or static evaluation"""
+        if not any(board.generate_legal_moves()):
+            return None, -MATE_SCORE if board.is_check() else 0, 0
+        self.material = self.material_score(board)
+        return None, self.relative_eval(board), 0
+
+    def evaluate_positions(self, fens, time_budget_ms, max_depth, total_time_ms=None):
+        """Best move, score for the side to move and depth for each position, for game review.
+
+        Positions are searched last to first so each one finds the following
+        positions' subtrees already in the transposition table. With total_time_ms
+        the whole batch keeps to that budget: each position gets at most an even
+        share of the time left, and positions still waiting when it runs out get
+        their static evaluation instead of a search.
+        """
+        self.reset_stats()
+        self.start_time = time.monotonic()
+        end_time = self.start_time + total_time_ms / 1000.0 if total_time_ms is not None else None
+        results = [None] * len(fens)
+        for index in range(len(fens) - 1, -1, -1):
+            board = chess.Board(fens[index])
+            moves = list(board.legal_moves)
+            remaining_ms = (end_time - time.monotonic()) * 1000.0 if end_time is not None else None
+            if not moves or (remaining_ms is not None and remaining_ms <= 0):
+                results[index] = self.unsearched_result(board)
+                continue
+            
+            budget_ms = time_budget_ms
+            if remaining_ms is not None:
+                budget_ms = max(1, min(time_budget_ms, remaining_ms / (index + 1)))
+            self.completed_depth = 0
+            self.start_search(board, budget_ms)
+            self.iterative_deepening(board, self.order_moves(board, moves), max_depth)
+            if self.root_lines:
+                move, score = self.root_lines[0]
+                results[index] = (move.uci(), score, self.completed_depth)
+            else:
+                results[index] = (None, self.relative_eval(board), 0)
+        self.finish_stats('review')
+        return results
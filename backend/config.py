@@ -25,7 +25,89 @@ DATABASE_NAME = 'chess_app'
 
 # Chess AI Configuration
 DEFAULT_AI_DIFFICULTY = 3
-MAX_AI_SEARCH_DEPTH = 3
+MAX_AI_SEARCH_DEPTH = 5
+AI_TRANSPOSITION_TABLE_SIZE = 2 ** 18  # entries per worker process
+# Strength per difficulty: search limits, plus how many of the top MultiPV moves
+# the engine may pick from and how many centipawns it may give up doing so
+AI_DIFFICULTY_LEVELS = {
+    1: {'max_depth': 2, 'max_nodes': 2000, 'max_time_ms': 200, 'multipv': 4, 'max_loss': 250},
+    2: {'max_depth': 3, 'max_nodes': 5000, 'max_time_ms': 300, 'multipv': 3, 'max_loss': 120},
+    3: {'max_depth': 3, 'max_nodes': 10000, 'max_time_ms': 500, 'multipv': 3, 'max_loss': 60},
+    4: {'max_depth': 4, 'max_nodes': 25000, 'max_time_ms': 800, 'multipv': 2, 'max_loss': 25},
+    5: {'max_depth': MAX_AI_SEARCH_DEPTH, 'max_nodes': None, 'max_time_ms': None, 'multipv': 1, 'max_loss': 0},
+}
+AI_MOVE_TIME_MS = 1500  # default search time per AI move
+AI_MAX_MOVE_TIME_MS = 5000  # upper limit for per-request time budgets
+AI_ANALYSIS_TIME_MS = 1000  # default time for /api/analyze
+AI_ANALYSIS_MAX_DEPTH = 10
+AI_ANALYSIS_MAX_LINES = 5  # MultiPV limit per analysis request
+
+# Post-game review: total time per game, split across the positions and workers
+AI_REVIEW_TIME_MS = 8000
+AI_REVIEW_MIN_POSITION_MS = 10
+AI_REVIEW_MAX_POSITION_MS = 500
+AI_REVIEW_MAX_DEPTH = 6
+AI_REVIEW_MAX_PLIES = 300
+AI_REVIEW_WORKERS = 2  # pool workers one review may use at once (one pool worker always stays free)
+AI_REVIEW_THRESHOLDS = {'inaccuracy': 50, 'mistake': 100, 'blunder': 300}  # centipawns lost
+AI_OPENING_BOOK_PATH = os.getenv('AI_OPENING_BOOK_PATH', 'books/opening_book.bin')  # Polyglot .bin, optional
+AI_SYZYGY_PATH = os.getenv('AI_SYZYGY_PATH', '')  # directory of Syzygy tables, optional
+AI_SYZYGY_MAX_PIECES = 5  # probe positions with at most this many pieces
+AI_SYZYGY_CACHE_SIZE = 65536  # cached probe results per worker process
+
+# Engine worker pool (0 runs searches inline in the web worker)
+ENGINE_POOL_SIZE = int(os.getenv('ENGINE_POOL_SIZE', '2'))
+ENGINE_POOL_START_METHOD = 'fork'
+ENGINE_POOL_TIMEOUT_GRACE_MS = 1000  # extra wait on top of the search budget; also the longest wait for an idle worker
+
+# External UCI engine for AI moves instead of ChessAI, e.g. "/usr/bin/stockfish" (empty disables)
+AI_EXTERNAL_ENGINE = os.getenv('AI_EXTERNAL_ENGINE', '')
+AI_EXTERNAL_ENGINE_POOL_SIZE = int(os.getenv('AI_EXTERNAL_ENGINE_POOL_SIZE', '2'))
+AI_EXTERNAL_ENGINE_ELO = {1: 1350, 2: 1600, 3: 1850, 4: 2100, 5: None}  # UCI_Elo per difficulty, None = full strength
+
+# Lazy SMP: processes that search one position together through a shared table (0 disables)
+AI_SMP_PROCESSES = int(os.getenv('AI_SMP_PROCESSES', '0'))
+AI_SMP_MIN_DIFFICULTY = 5
+AI_SMP_MAX_SEARCH_DEPTH = 7
+AI_SMP_TABLE_SIZE = 2 ** 20  # entries, 16 bytes each
+
+# Pondering: search the predicted reply on idle workers while the player thinks
+AI_PONDER_ENABLED = os.getenv('AI_PONDER_ENABLED', 'true').lower() == 'true'
+AI_PONDER_TIME_MS = 10000  # longest background search per move
+AI_PONDER_WORKER_SHARE = 0.5  # fraction of the pool pondering may occupy
+AI_PONDER_MAX_GAMES = 1000  # pondered games remembered per web worker
+
+# Game Session Configuration
+GAME_SESSION_CAPACITY = 10000  # live games kept in memory per worker
+GAME_SESSION_TTL = 30 * 60  # seconds of inactivity before a game is saved and evicted
+GAME_SNAPSHOT_INTERVAL = 16  # plies between stored FEN snapshots, so seeking replays at most this many moves
+
+# Search result cache: (position, difficulty) -> top moves, in memory and optionally in MongoDB
+AI_RESULT_CACHE_SIZE = 50000  # entries per web worker
+AI_RESULT_CACHE_PERSIST = os.getenv('AI_RESULT_CACHE_PERSIST', 'false').lower() == 'true'
+AI_RESULT_CACHE_TTL = 7 * 24 * 60 * 60  # seconds before MongoDB drops a cached result
+
+# Multiplayer games over Socket.IO
+MULTIPLAYER_DEFAULT_BASE_SECONDS = 5 * 60
+MULTIPLAYER_DEFAULT_INCREMENT_SECONDS = 3
+MULTIPLAYER_MAX_BASE_SECONDS = 3 * 60 * 60
+MULTIPLAYER_MAX_INCREMENT_SECONDS = 60
+MULTIPLAYER_WAITING_TTL = 10 * 60  # seconds an unjoined game stays open
+MULTIPLAYER_FLUSH_INTERVAL = 2  # seconds between batched move writes
+MULTIPLAYER_CLOCK_INTERVAL = 0.5  # seconds between flag checks
+
+# Matchmaking: players queue by time control and rating; the accepted rating gap widens while they wait
+MATCHMAKING_BUCKET_WIDTH = 50  # rating points per queue bucket
+MATCHMAKING_INITIAL_WINDOW = 100  # rating gap accepted straight away
+MATCHMAKING_WINDOW_GROWTH = 10  # extra rating points accepted per second of waiting
+MATCHMAKING_MAX_WINDOW = 500
+MATCHMAKING_SWEEP_INTERVAL = 1  # seconds between re-matching players whose window has grown
+
+# Opening explorer: move statistics per position from finished games
+EXPLORER_MAX_PLIES = 40  # plies of each game added to the index
+EXPLORER_CACHE_PLIES = 15  # positions up to this ply are kept in the in-memory cache
+EXPLORER_CACHE_SIZE = 100000  # cached positions per web worker
+EXPLORER_CACHE_TTL = 60  # seconds before a cached position is reloaded (picks up other workers' games)
 
 # WebSocket Configuration
 CLEANUP_INTERVAL = 60  # seconds
@@ -1,5 +1,5 @@
 from pymongo import MongoClient
-from config import MONGODB_URI, DATABASE_NAME
+from config import MONGODB_URI, DATABASE_NAME, AI_RESULT_CACHE_TTL
 import os
 
 # MongoDB connection
@@ -19,6 +19,8 @@ try:
     privacy_settings_collection = db['privacy_settings']
     messages_collection = db['messages']
     chat_rooms_collection = db['chat_rooms']
+    engine_cache_collection = db['engine_cache']
+    explorer_collection = db['opening_explorer']
     
     print("Connected to MongoDB successfully")
 except Exception as e:
@@ -37,6 +39,8 @@ def create_database_indexes():
         chat_rooms_collection.create_index('participants')
         newsletter_subscriptions_collection.create_index([('user_id', 1), ('newsletter_id', 1)], unique=True)
         privacy_settings_collection.create_index('user_id', unique=True)
+        engine_cache_collection.create_index('created_at', expireAfterSeconds=AI_RESULT_CACHE_TTL)
+        explorer_collection.create_index([('position', 1), ('move', 1)], unique=True)
         
         print("Database indexes created successfully")
     except Exception as e:
@@ -0,0 +1,490 @@
+import multiprocessing
+import time
+from collections import OrderedDict
+import chess
+import eventlet
+from eventlet import hubs
+from eventlet.queue import LightQueue, Empty
+from eventlet.semaphore import Semaphore
+from eventlet.timeout import Timeout
+from chess_ai import ChessAI, SharedTranspositionTable
+from engine_stats import search_histogram
+from search_cache import result_cache
+from config import (
+    ENGINE_POOL_SIZE, ENGINE_POOL_START_METHOD, ENGINE_POOL_TIMEOUT_GRACE_MS, AI_MOVE_TIME_MS,
+    AI_SMP_PROCESSES, AI_SMP_MIN_DIFFICULTY, AI_SMP_MAX_SEARCH_DEPTH, AI_SMP_TABLE_SIZE,
+    AI_PONDER_TIME_MS, AI_PONDER_WORKER_SHARE, AI_PONDER_MAX_GAMES, AI_EXTERNAL_ENGINE
+)
+
+class EngineTimeout(Exception):
+    """Raised when no engine worker produced a result in time, or the worker failed"""
+    pass
+
+def _worker_main(conn, stop_flag, shared_table=None, helper_index=0):
+    """Engine process loop: one warm ChessAI answering search requests from a pipe"""
+    if shared_table is not None:
+        ai = ChessAI(transposition_table=SharedTranspositionTable(shared_table, owner=helper_index == 0))
+    else:
+        ai = ChessAI()
+    ai.stop_flag = stop_flag
+    ai.helper_index = helper_index
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+
+        command = request[0]
+        try:
+            if command == 'analyze':
+                fen, multipv, time_budget_ms = request[1:]
+                lines = ai.analyze(chess.Board(fen), multipv, time_budget_ms)
+                conn.send((lines, ai.search_stats()))
+                continue
+            if command == 'review':
+                fens, time_budget_ms, max_depth, total_time_ms = request[1:]
+                results = ai.evaluate_positions(fens, time_budget_ms, max_depth, total_time_ms)
+                conn.send((results, ai.search_stats()))
+                continue
+            fen, difficulty, time_budget_ms, max_depth = request[1:]
+            ai.difficulty = max(1, min(5, difficulty))
+            move = ai.get_best_move(chess.Board(fen), time_budget_ms, max_depth)
+            conn.send((move.uci() if move else None, ai.search_stats()))
+        except Exception as e:
+            print(f"Error in engine worker: {e}")
+            conn.send((None, None))
+
+class _Worker:
+    def __init__(self, context, stop_flag=None, shared_table=None, helper_index=0):
+        self.conn, child_conn = context.Pipe()
+        self.stop_flag = stop_flag if stop_flag is not None else context.Value('b', 0)
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, self.stop_flag, shared_table, helper_index), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_readable(self, timeout):
+        """Wait for a reply without blocking the eventlet hub"""
+        try:
+            hubs.trampoline(self.conn.fileno(), read=True, timeout=timeout)
+            return True
+        except Timeout:
+            return False
+
+    def terminate(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        self.process.terminate()
+        self.process.join(1)
+
+class _SmpGroup:
+    """Lazy SMP: processes searching the same root through one shared transposition table.
+
+    Worker 0 is the main search and its answer is the one returned; the helpers
+    only fill the table and are stopped as soon as the main search finishes.
+    """
+
+    def __init__(self, context, size, table_size=AI_SMP_TABLE_SIZE):
+        self.context = context
+        self.table = context.RawArray('Q', SharedTranspositionTable.words_for(table_size))
+        self.stop_flag = context.Value('b', 0)
+        self.workers = [self._spawn(index) for index in range(size)]
+        self.lock = Semaphore(1)
+
+    def _spawn(self, index):
+        return _Worker(self.context, self.stop_flag, self.table, index)
+
+    def _collect(self, index, grace):
+        """Read one worker's reply, replacing the worker if it doesn't answer in time"""
+        worker = self.workers[index]
+        try:
+            if worker.wait_readable(grace):
+                return worker.conn.recv()
+        except (EOFError, OSError):
+            pass
+        worker.terminate()
+        self.workers[index] = self._spawn(index)
+        return None, None
+
+    def _stop_helpers(self, first):
+        """Stop the search and drain the replies of workers from index first on"""
+        self.stop_flag.value = 1
+        grace = ENGINE_POOL_TIMEOUT_GRACE_MS / 1000.0
+        helper_nodes = 0
+        for index in range(first, len(self.workers)):
+            _, stats = self._collect(index, grace)
+            if stats is not None:
+                helper_nodes += stats['nodes']
+        self.stop_flag.value = 0
+        return helper_nodes
+
+    def _recover(self):
+        try:
+            self._stop_helpers(0)
+        finally:
+            self.lock.release()
+
+    def search(self, fen, difficulty, time_budget_ms, timeout):
+        """Search with every process in the group; the caller must hold self.lock"""
+        finished = False
+        try:
+            for worker in self.workers:
+                worker.conn.send(('move', fen, difficulty, time_budget_ms, AI_SMP_MAX_SEARCH_DEPTH))
+            main = self.workers[0]
+            if not main.wait_readable(timeout):
+                search_histogram.record_timeout()
+                raise EngineTimeout('Engine search timed out')
+            move, stats = main.conn.recv()
+            finished = True
+        except (EOFError, OSError):
+            raise EngineTimeout('Engine worker stopped unexpectedly')
+        finally:
+            if not finished:
+                eventlet.spawn_n(self._recover)
+
+        if stats is not None:
+            stats['processes'] = len(self.workers)
+        # Helpers are stopped and drained off this greenlet; the group stays locked until then
+        eventlet.spawn_n(self._finish, stats)
+        if stats is None:
+            raise EngineTimeout('Engine worker failed')
+        return move, stats
+
+    def _finish(self, stats):
+        """Drain the helpers after the main search answered, then record the whole group's work"""
+        try:
+            helper_nodes = self._stop_helpers(1)
+        finally:
+            self.lock.release()
+        if stats is None:
+            return
+        
+        # Report the work of the whole group so nps reflects every core
+        stats = dict(stats, nodes=stats['nodes'] + helper_nodes)
+        elapsed_seconds = stats['elapsedMs'] / 1000.0
+        stats['nps'] = int(stats['nodes'] / elapsed_seconds) if elapsed_seconds > 0 else 0
+        search_histogram.record(stats)
+
+    def terminate(self):
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.terminate()
+        self.workers = []
+
+class _Ponder:
+    """A background search of the position after the predicted reply"""
+
+    def __init__(self, fen, worker):
+        self.fen = fen
+        self.worker = worker
+        self.result = None
+        self.done = False
+        self.thread = None
+
+    def stop(self):
+        """Make the search return its deepest finished iteration now"""
+        if not self.done:
+            self.worker.stop_flag.value = 1
+
+class EnginePool:
+    """Pool of engine processes so searches never run on the eventlet loop"""
+
+    def __init__(self, size=ENGINE_POOL_SIZE, smp_processes=AI_SMP_PROCESSES):
+        self.size = size
+        self.smp_processes = smp_processes
+        self.context = multiprocessing.get_context(ENGINE_POOL_START_METHOD)
+        self.idle = LightQueue()
+        self.workers = []
+        self.smp_group = None
+        self.external = None  # ExternalEnginePool when AI moves come from a UCI binary
+        self.ponders = OrderedDict()  # game key -> _Ponder, oldest first
+        self.ponder_limit = int(size * AI_PONDER_WORKER_SHARE)
+        self.started = False
+
+    def start(self):
+        """Start the worker processes (safe to call more than once)"""
+        if self.started:
+            return
+        self.started = True
+        for _ in range(self.size):
+            worker = _Worker(self.context)
+            self.workers.append(worker)
+            self.idle.put(worker)
+        if self.smp_processes > 1:
+            self.smp_group = _SmpGroup(self.context, self.smp_processes)
+        if AI_EXTERNAL_ENGINE:
+            from uci_engine import ExternalEnginePool
+            self.external = ExternalEnginePool(AI_EXTERNAL_ENGINE)
+
+    def stop(self):
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.terminate()
+        self.workers = []
+        self.idle = LightQueue()
+        self.ponders = OrderedDict()
+        if self.smp_group is not None:
+            self.smp_group.terminate()
+            self.smp_group = None
+        if self.external is not None:
+            self.external.stop()
+            self.external = None
+        self.started = False
+
+    def _replace(self, worker):
+        """Kill a stuck or dead worker and start a fresh one in its place"""
+        worker.terminate()
+        replacement = _Worker(self.context)
+        self.workers = [replacement if w is worker else w for w in self.workers]
+        return replacement
+
+    def _recover(self, worker):
+        """Stop a search whose caller gave up, then hand the worker back"""
+        worker.stop_flag.value = 1
+        grace = ENGINE_POOL_TIMEOUT_GRACE_MS / 1000.0
+        try:
+            if worker.wait_readable(grace):
+                worker.conn.recv()
+            else:
+                worker = self._replace(worker)
+        except (EOFError, OSError):
+            worker = self._replace(worker)
+        worker.stop_flag.value = 0
+        self.idle.put(worker)
+
+    def get_best_move(self, fen, difficulty, time_budget_ms=AI_MOVE_TIME_MS):
+        """Best move from the result cache or a worker process search; returns (UCI move, search stats)"""
+        difficulty = max(1, min(5, int(difficulty)))
+        entry = result_cache.get(fen, difficulty)
+        if entry is not None:
+            move = result_cache.choose(entry, difficulty)
+            stats = {
+                'difficulty': difficulty,
+                'source': 'cache',
+                'nodes': 0,
+                'qnodes': 0,
+                'ttHits': 0,
+                'betaCutoffs': 0,
+                'firstMoveCutoffs': 0,
+                'depth': entry['depth'],
+                'elapsedMs': 0.0,
+                'nps': 0,
+                'pv': [move],
+                'lines': entry['lines'],
+            }
+            search_histogram.record(stats)
+            return move, stats
+
+        move, stats = self._search(fen, difficulty, time_budget_ms)
+        self._remember(fen, stats)
+        return move, stats
+
+    def _remember(self, fen, stats):
+        """Cache the root lines of a finished search"""
+        if stats is not None and stats['source'] in ('search', 'ponder'):
+            result_cache.put(fen, stats['difficulty'], stats['lines'], stats['depth'])
+
+    def _search(self, fen, difficulty, time_budget_ms):
+        self.start()
+        if self.external is not None:
+            return self.external.get_best_move(fen, difficulty, time_budget_ms)
+        if self.size <= 0:
+            ai = ChessAI(difficulty)
+            move = ai.get_best_move(chess.Board(fen), time_budget_ms)
+            stats = ai.search_stats()
+            search_histogram.record(stats)
+            return (move.uci() if move else None), stats
+
+        timeout = (time_budget_ms + ENGINE_POOL_TIMEOUT_GRACE_MS) / 1000.0
+
+        # Strong levels get the parallel group when it is free; otherwise they
+        # fall back to a single worker rather than queueing behind another search
+        group = self.smp_group
+        if group is not None and difficulty >= AI_SMP_MIN_DIFFICULTY and group.lock.acquire(blocking=False):
+            return group.search(fen, difficulty, time_budget_ms, timeout)
+
+        move, stats = self._run(('move', fen, difficulty, time_budget_ms, None), timeout)
+        if stats is not None:
+            search_histogram.record(stats)
+        return move, stats
+
+    def analyze(self, fen, multipv, time_budget_ms):
+        """MultiPV analysis in a worker process; returns (lines, search stats)"""
+        if self.size <= 0:
+            ai = ChessAI()
+            lines = ai.analyze(chess.Board(fen), multipv, time_budget_ms)
+            return lines, ai.search_stats()
+
+        self.start()
+        timeout = (time_budget_ms + ENGINE_POOL_TIMEOUT_GRACE_MS) / 1000.0
+        return self._run(('analyze', fen, multipv, time_budget_ms), timeout)
+
+    def batch_workers(self, max_workers):
+        """Workers a batch job may use; like pondering it leaves one free for foreground searches"""
+        return max(1, min(max_workers, self.size - 1))
+
+    def evaluate_positions(self, fens, position_time_ms, max_depth, max_workers=1):
+        """Evaluate many positions, split into contiguous chunks across up to max_workers workers.
+
+        Returns one (best UCI move, score for the side to move, depth) per position.
+        Positions of a chunk that failed get their static evaluation, so one slow
+        worker doesn't lose the whole review; only a total failure raises.
+        """
+        if self.size <= 0:
+            return ChessAI().evaluate_positions(fens, position_time_ms, max_depth, position_time_ms * len(fens))
+
+        self.start()
+        # Contiguous chunks keep neighbouring positions, which share subtrees, in one table
+        chunks = max(1, min(self.batch_workers(max_workers), len(fens)))
+        chunk_size = (len(fens) + chunks - 1) // chunks
+        # Each chunk keeps to one overall budget, so per-position overruns don't add up
+        chunk_time_ms = position_time_ms * chunk_size
+        requests = [
+            ('review', fens[start:start + chunk_size], position_time_ms, max_depth, chunk_time_ms)
+            for start in range(0, len(fens), chunk_size)
+        ]
+        timeout = (chunk_time_ms + ENGINE_POOL_TIMEOUT_GRACE_MS) / 1000.0
+        threads = [eventlet.spawn(self._run, request, timeout) for request in requests]
+
+        results = []
+        failures = 0
+        for request, thread in zip(requests, threads):
+            try:
+                chunk_results, _ = thread.wait()
+            except EngineTimeout as e:
+                print(f"Error in review chunk: {e}")
+                failures += 1
+                ai = ChessAI()
+                chunk_results = [ai.unsearched_result(chess.Board(fen)) for fen in request[1]]
+            results.extend(chunk_results)
+        if failures == len(threads):
+            raise EngineTimeout('Engine workers failed during review')
+        return results
+
+    def ponder(self, key, fen, difficulty):
+        """Search fen in the background for the game key; returns False if the ponder budget is used up"""
+        self.cancel_ponder(key)
+        if self.size <= 0:
+            return False
+        self.start()
+        if self.external is not None:
+            return False
+
+        # Pondering only takes a worker when another one stays idle for foreground searches
+        running = sum(1 for ponder in self.ponders.values() if not ponder.done)
+        if running >= self.ponder_limit or self.idle.qsize() < 2:
+            return False
+        try:
+            worker = self.idle.get_nowait()
+        except Empty:
+            return False
+
+        ponder = _Ponder(fen, worker)
+        self.ponders[key] = ponder
+        while len(self.ponders) > AI_PONDER_MAX_GAMES:
+            self.ponders.popitem(last=False)[1].stop()
+        ponder.thread = eventlet.spawn(self._ponder, ponder, difficulty)
+        return True
+
+    def _ponder(self, ponder, difficulty):
+        worker = ponder.worker
+        timeout = (AI_PONDER_TIME_MS + ENGINE_POOL_TIMEOUT_GRACE_MS) / 1000.0
+        try:
+            worker.conn.send(('move', ponder.fen, difficulty, AI_PONDER_TIME_MS, None))
+            if worker.wait_readable(timeout):
+                ponder.result = worker.conn.recv()
+                ponder.done = True
+                worker.stop_flag.value = 0
+                self.idle.put(worker)
+                return
+        except (EOFError, OSError):
+            pass
+        ponder.done = True
+        eventlet.spawn_n(self._recover, worker)
+
+    def take_ponder(self, key, fen, time_budget_ms):
+        """The game's ponder result as (UCI move, stats) if it searched fen, else None.
+
+        On a hit an unfinished ponder search gets up to time_budget_ms more before it is stopped.
+        """
+        ponder = self.ponders.pop(key, None)
+        if ponder is None:
+            return None
+        if ponder.fen != fen:
+            ponder.stop()
+            search_histogram.record_ponder_miss()
+            return None
+
+        if not ponder.done:
+            with Timeout(time_budget_ms / 1000.0, False):
+                ponder.thread.wait()
+            ponder.stop()
+            ponder.thread.wait()
+
+        if ponder.result is None or ponder.result[0] is None:
+            return None
+        move, stats = ponder.result
+        if stats is not None:
+            stats['source'] = 'ponder'
+            search_histogram.record(stats)
+            self._remember(fen, stats)
+        return move, stats
+
+    def cancel_ponder(self, key):
+        ponder = self.ponders.pop(key, None)
+        if ponder is not None:
+            ponder.stop()
+
+    def _run(self, request, timeout):
+        """Send one request to an idle worker and wait for its (result, stats) reply.
+
+        The wait for a worker is capped at the grace period and counts against
+        the same timeout as the search, so a reply never takes longer than timeout.
+        """
+        deadline = time.monotonic() + timeout
+        if self.idle.qsize() == 0:
+            # Foreground searches come first: stop the oldest running ponder to free its worker
+            for ponder in self.ponders.values():
+                if not ponder.done:
+                    ponder.stop()
+                    break
+        try:
+            worker = self.idle.get(timeout=min(timeout, ENGINE_POOL_TIMEOUT_GRACE_MS / 1000.0))
+        except Empty:
+            raise EngineTimeout('All engine workers are busy')
+
+        finished = False
+        try:
+            worker.conn.send(request)
+            if not worker.wait_readable(max(0.0, deadline - time.monotonic())):
+                search_histogram.record_timeout()
+                raise EngineTimeout('Engine search timed out')
+            result = worker.conn.recv()
+            finished = True
+        except (EOFError, OSError):
+            raise EngineTimeout('Engine worker stopped unexpectedly')
+        finally:
+            if finished:
+                self.idle.put(worker)
+            else:
+                # Timed out, crashed or the request was cancelled: clean up off this greenlet
+                eventlet.spawn_n(self._recover, worker)
+        
+        # The worker answers (None, None) when the search raised
+        if result[1] is None:
+            raise EngineTimeout('Engine worker failed')
+        return result
+
+# One pool per web worker process
+engine_pool = EnginePool()
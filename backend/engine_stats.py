@@ -0,0 +1,96 @@
+import bisect
+
+# Upper bounds of the histogram buckets; the last bucket is open-ended
+ELAPSED_MS_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+NODE_BUCKETS = [100, 1000, 10000, 50000, 100000, 500000, 1000000]
+
+class SearchHistogram:
+    """Process-wide aggregate of engine search statistics"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.searches = 0
+        self.timeouts = 0
+        self.ponder_misses = 0
+        self.total_nodes = 0
+        self.total_elapsed_ms = 0.0
+        self.elapsed_ms_counts = [0] * (len(ELAPSED_MS_BUCKETS) + 1)
+        self.node_counts = [0] * (len(NODE_BUCKETS) + 1)
+        self.depth_counts = {}
+        self.source_counts = {}
+        self.by_difficulty = {}
+
+    def record(self, stats):
+        """Add the stats dict returned by ChessAI.search_stats"""
+        self.searches += 1
+        self.total_nodes += stats['nodes']
+        self.total_elapsed_ms += stats['elapsedMs']
+        self.elapsed_ms_counts[bisect.bisect_left(ELAPSED_MS_BUCKETS, stats['elapsedMs'])] += 1
+        self.node_counts[bisect.bisect_left(NODE_BUCKETS, stats['nodes'])] += 1
+
+        depth = stats['depth']
+        self.depth_counts[depth] = self.depth_counts.get(depth, 0) + 1
+        source = stats['source']
+        self.source_counts[source] = self.source_counts.get(source, 0) + 1
+
+        level = self.by_difficulty.setdefault(stats['difficulty'], {
+            'searches': 0, 'nodes': 0, 'elapsedMs': 0.0, 'depth': 0
+        })
+        level['searches'] += 1
+        level['nodes'] += stats['nodes']
+        level['elapsedMs'] += stats['elapsedMs']
+        level['depth'] += depth
+
+    def record_timeout(self):
+        self.timeouts += 1
+
+    def record_ponder_miss(self):
+        self.ponder_misses += 1
+
+    def percentile_ms(self, fraction):
+        """Upper bucket bound below which the given fraction of searches finished"""
+        if not self.searches:
+            return None
+        target = fraction * self.searches
+        seen = 0
+        for index, count in enumerate(self.elapsed_ms_counts):
+            seen += count
+            if seen >= target:
+                return ELAPSED_MS_BUCKETS[index] if index < len(ELAPSED_MS_BUCKETS) else None
+        return None
+
+    def snapshot(self):
+        """JSON-ready summary of everything recorded so far"""
+        def bucket_labels(bounds):
+            return [f'<={bound}' for bound in bounds] + [f'>{bounds[-1]}']
+
+        difficulty_summary = {}
+        for difficulty, level in sorted(self.by_difficulty.items()):
+            searches = level['searches']
+            difficulty_summary[str(difficulty)] = {
+                'searches': searches,
+                'avgNodes': int(level['nodes'] / searches),
+                'avgElapsedMs': round(level['elapsedMs'] / searches, 2),
+                'avgDepth': round(level['depth'] / searches, 2),
+            }
+
+        total_seconds = self.total_elapsed_ms / 1000.0
+        return {
+            'searches': self.searches,
+            'timeouts': self.timeouts,
+            'ponderMisses': self.ponder_misses,
+            'totalNodes': self.total_nodes,
+            'avgNps': int(self.total_nodes / total_seconds) if total_seconds > 0 else 0,
+            'p50Ms': self.percentile_ms(0.5),
+            'p99Ms': self.percentile_ms(0.99),
+            'elapsedMs': dict(zip(bucket_labels(ELAPSED_MS_BUCKETS), self.elapsed_ms_counts)),
+            'nodes': dict(zip(bucket_labels(NODE_BUCKETS), self.node_counts)),
+            'depth': {str(depth): count for depth, count in sorted(self.depth_counts.items())},
+            'source': dict(self.source_counts),
+            'byDifficulty': difficulty_summary,
+        }
+
+# One histogram per web worker process
+search_histogram = SearchHistogram()
@@ -0,0 +1,49 @@
+import chess
+from move_codec import decode_moves, move_count
+from config import GAME_SNAPSHOT_INTERVAL
+
+def snapshot_fens(board, interval=GAME_SNAPSHOT_INTERVAL):
+    """FENs after every interval plies of a board's move stack"""
+    replay = board.root()
+    fens = []
+    for ply, move in enumerate(board.move_stack, 1):
+        replay.push(move)
+        if ply % interval == 0:
+            fens.append(replay.fen())
+    return fens
+
+def snapshots_field(fens, interval=GAME_SNAPSHOT_INTERVAL):
+    """Stored form of a game's snapshots; the interval is kept so it can change later"""
+    return {'interval': interval, 'fens': fens}
+
+def seek(document, ply):
+    """Board at a ply of a stored game, replayed from the nearest snapshot before it.
+
+    The snapshot is always strictly before the ply, so the board's move stack
+    ends with the move played at that ply. Games saved without snapshots are
+    replayed from the start.
+    """
+    moves = document.get('moves')
+    ply = max(0, min(ply, move_count(moves)))
+    snapshots = document.get('snapshots') or {}
+    interval = snapshots.get('interval')
+    fens = snapshots.get('fens', [])
+
+    board = chess.Board()
+    start = 0
+    index = min((ply - 1) // interval, len(fens)) if interval and ply else 0
+    if index:
+        board = chess.Board(fens[index - 1])
+        start = index * interval
+    for move in decode_moves(moves, start, ply):
+        board.push(move)
+    return board
+
+def iter_positions(document):
+    """Every position of a stored game in order, for replay UIs"""
+    board = chess.Board()
+    yield {'ply': 0, 'fen': board.fen()}
+    for move in decode_moves(document.get('moves')):
+        san = board.san(move)
+        board.push(move)
+        yield {'ply': board.ply(), 'move': move.uci(), 'san': san, 'fen': board.fen()}
@@ -0,0 +1,92 @@
+import datetime
+import chess
+from chess_ai import MATE_SCORE, MAX_PLY
+from engine_pool import engine_pool
+from config import (
+    AI_REVIEW_TIME_MS, AI_REVIEW_MIN_POSITION_MS, AI_REVIEW_MAX_POSITION_MS, AI_REVIEW_MAX_DEPTH,
+    AI_REVIEW_MAX_PLIES, AI_REVIEW_WORKERS, AI_REVIEW_THRESHOLDS
+)
+
+# One character per move in the stored review
+MOVE_CLASSES = {'best': 'b', 'good': 'g', 'inaccuracy': 'i', 'mistake': 'm', 'blunder': 'B'}
+
+# Mate scores are capped so one missed mate doesn't swamp the average loss
+REVIEW_SCORE_CAP = 1000
+
+def capped_score(score):
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        return REVIEW_SCORE_CAP if score > 0 else -REVIEW_SCORE_CAP
+    return max(-REVIEW_SCORE_CAP, min(REVIEW_SCORE_CAP, score))
+
+def classify_move(move, best_move, loss):
+    """Classification name for a move that gave up loss centipawns"""
+    if move == best_move or loss < AI_REVIEW_THRESHOLDS['inaccuracy']:
+        return 'best' if move == best_move else 'good'
+    if loss >= AI_REVIEW_THRESHOLDS['blunder']:
+        return 'blunder'
+    if loss >= AI_REVIEW_THRESHOLDS['mistake']:
+        return 'mistake'
+    return 'inaccuracy'
+
+def position_time_ms(plies):
+    """Per-position search time that keeps the whole review within AI_REVIEW_TIME_MS"""
+    workers = engine_pool.batch_workers(AI_REVIEW_WORKERS)
+    share = AI_REVIEW_TIME_MS * workers // max(1, plies + 1)
+    return max(AI_REVIEW_MIN_POSITION_MS, min(AI_REVIEW_MAX_POSITION_MS, share))
+
+def review_moves(moves, start_fen=chess.STARTING_FEN):
+    """Evaluate every position of a game and classify each move.
+
+    Returns the compact document stored on the game: white-relative evals per
+    position, the engine's best move and a class character per move, and
+    average centipawn loss and class counts per side.
+    """
+    board = chess.Board(start_fen)
+    moves = moves[:AI_REVIEW_MAX_PLIES]
+    fens = [board.fen()]
+    for move in moves:
+        board.push(move)
+        fens.append(board.fen())
+
+    results = engine_pool.evaluate_positions(
+        fens, position_time_ms(len(moves)), AI_REVIEW_MAX_DEPTH, AI_REVIEW_WORKERS
+    )
+
+    board = chess.Board(start_fen)
+    evals = []
+    best_moves = []
+    classes = []
+    summary = {
+        color: {'moves': 0, 'totalLoss': 0, **{name: 0 for name in MOVE_CLASSES}}
+        for color in ('white', 'black')
+    }
+    for index, (best_uci, score, _) in enumerate(results):
+        sign = 1 if board.turn == chess.WHITE else -1
+        evals.append(capped_score(score) * sign)
+        if index == len(moves):
+            break
+
+        # The mover's best score against what was left after the played move
+        move = moves[index]
+        loss = max(0, capped_score(score) + capped_score(results[index + 1][1]))
+        name = classify_move(move.uci(), best_uci, loss)
+        best_moves.append(best_uci)
+        classes.append(MOVE_CLASSES[name])
+
+        side = summary['white' if board.turn == chess.WHITE else 'black']
+        side['moves'] += 1
+        side['totalLoss'] += loss
+        side[name] += 1
+        board.push(move)
+
+    for side in summary.values():
+        side['avgLoss'] = round(side.pop('totalLoss') / side['moves'], 1) if side['moves'] else 0
+
+    return {
+        'evals': evals,
+        'bestMoves': best_moves,
+        'classes': ''.join(classes),
+        'depth': min((depth for best_uci, _, depth in results if best_uci), default=0),
+        'summary': summary,
+        'reviewedAt': datetime.datetime.utcnow()
+    }
@@ -0,0 +1,149 @@
+import datetime
+import time
+from collections import OrderedDict
+import chess
+from bson import ObjectId
+from config import DEFAULT_AI_DIFFICULTY, GAME_SESSION_CAPACITY, GAME_SESSION_TTL, AI_PONDER_ENABLED
+from database import games_collection
+from move_codec import encode_moves, replay
+from game_replay import snapshot_fens, snapshots_field
+from opening_explorer import opening_explorer
+
+def game_status(board):
+    """Return (status, result) with the result from white's (the player's) side"""
+    if board.is_checkmate():
+        return 'ended', 'win' if board.turn == chess.BLACK else 'loss'
+    if (board.is_stalemate() or board.is_insufficient_material()
+            or board.is_repetition(3) or board.is_fifty_moves()):
+        return 'ended', 'draw'
+    return 'playing', None
+
+# game_status results (from the player's side, who plays white) as PGN results
+PGN_RESULTS = {'win': '1-0', 'loss': '0-1', 'draw': '1/2-1/2'}
+
+def captured_piece_symbol(board, move):
+    """Symbol of the piece a move captures (before it is pushed), or None"""
+    if board.is_en_passant(move):
+        return 'p' if board.turn == chess.WHITE else 'P'
+    piece = board.piece_at(move.to_square)
+    return piece.symbol() if piece else None
+
+class GameSession:
+    """A live game against the AI, held in memory with its full move stack"""
+
+    def __init__(self, game_id, user_id, difficulty=DEFAULT_AI_DIFFICULTY, board=None, ponder=AI_PONDER_ENABLED):
+        self.game_id = game_id
+        self.user_id = user_id
+        self.difficulty = difficulty
+        self.ponder = ponder  # search the predicted reply while the player thinks
+        self.board = board if board is not None else chess.Board()
+        self.created_at = datetime.datetime.utcnow()
+        self.last_access = time.monotonic()
+
+    def to_document(self):
+        status, result = game_status(self.board)
+        return {
+            'user_id': self.user_id,
+            'session': True,
+            'game_type': 'ai',
+            'difficulty': self.difficulty,
+            'ponder': self.ponder,
+            'moves': encode_moves(self.board.move_stack),
+            'snapshots': snapshots_field(snapshot_fens(self.board)),
+            'fen': self.board.fen(),
+            'status': status,
+            'result': result,
+            'created_at': self.created_at,
+            'updated_at': datetime.datetime.utcnow()
+        }
+
+    @classmethod
+    def from_document(cls, document):
+        board = replay(document.get('moves'))
+        session = cls(
+            str(document['_id']), document['user_id'], document.get('difficulty', DEFAULT_AI_DIFFICULTY), board,
+            document.get('ponder', AI_PONDER_ENABLED)
+        )
+        session.created_at = document.get('created_at', session.created_at)
+        return session
+
+class GameSessionStore:
+    """LRU/TTL cache of game sessions; evicted sessions are saved to games_collection.
+
+    Sessions live in the worker that created them, so a game needs sticky routing
+    to stay in memory; any other worker reloads it from the database.
+    """
+
+    def __init__(self, capacity=GAME_SESSION_CAPACITY, ttl=GAME_SESSION_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.sessions = OrderedDict()  # game_id -> GameSession, least recently used first
+
+    def create(self, user_id, difficulty=DEFAULT_AI_DIFFICULTY, ponder=AI_PONDER_ENABLED):
+        session = GameSession(str(ObjectId()), user_id, difficulty, ponder=ponder)
+        self._add(session)
+        return session
+
+    def get(self, game_id, user_id):
+        """Return the user's session, reloading it from the database if it was evicted"""
+        self.evict_expired()
+        session = self.sessions.get(game_id)
+        if session is None:
+            if not ObjectId.is_valid(game_id):
+                return None
+            document = games_collection.find_one({'_id': ObjectId(game_id), 'session': True})
+            if not document:
+                return None
+            session = GameSession.from_document(document)
+            self._add(session)
+
+        if session.user_id != user_id:
+            return None
+
+        session.last_access = time.monotonic()
+        self.sessions.move_to_end(game_id)
+        return session
+
+    def persist(self, session):
+        games_collection.update_one(
+            {'_id': ObjectId(session.game_id)},
+            {'$set': session.to_document()},
+            upsert=True
+        )
+
+    def save_review(self, session, review):
+        """Store a post-game review on the session's game document"""
+        document = session.to_document()
+        document['review'] = review
+        games_collection.update_one({'_id': ObjectId(session.game_id)}, {'$set': document}, upsert=True)
+
+    def close(self, session):
+        """Save a finished game, add the player's moves to the opening explorer and drop it from memory"""
+        self.persist(session)
+        self.sessions.pop(session.game_id, None)
+        status, result = game_status(session.board)
+        if status == 'ended':
+            opening_explorer.record_game(session.board.move_stack, PGN_RESULTS[result], colors=(chess.WHITE,))
+
+    def evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_access > cutoff:
+                break
+            self._evict(session)
+
+    def _add(self, session):
+        self.sessions[session.game_id] = session
+        while len(self.sessions) > self.capacity:
+            self._evict(next(iter(self.sessions.values())))
+
+    def _evict(self, session):
+        self.sessions.pop(session.game_id, None)
+        try:
+            self.persist(session)
+        except Exception as e:
+            print(f"Error saving game session {session.game_id}: {e}")
+
+# Sessions for this worker process
+game_sessions = GameSessionStore()
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from config import (
+    MATCHMAKING_BUCKET_WIDTH, MATCHMAKING_INITIAL_WINDOW, MATCHMAKING_WINDOW_GROWTH, MATCHMAKING_MAX_WINDOW
+)
+
+class QueueEntry:
+    """A player waiting for an opponent"""
+
+    __slots__ = ('user_id', 'rating', 'time_control', 'enqueued_at')
+
+    def __init__(self, user_id, rating, time_control, enqueued_at):
+        self.user_id = user_id
+        self.rating = rating
+        self.time_control = time_control  # (base seconds, increment seconds)
+        self.enqueued_at = enqueued_at
+
+    def window(self, now):
+        """Largest rating gap this player accepts after waiting until now"""
+        waited = now - self.enqueued_at
+        return min(MATCHMAKING_MAX_WINDOW, MATCHMAKING_INITIAL_WINDOW + MATCHMAKING_WINDOW_GROWTH * waited)
+
+class MatchmakingQueue:
+    """Waiting players bucketed by (time control, rating bucket), oldest first within a bucket.
+
+    Finding an opponent only looks at the buckets inside the player's rating
+    window, so the cost doesn't grow with the number of queued players.
+    """
+
+    def __init__(self, bucket_width=MATCHMAKING_BUCKET_WIDTH):
+        self.bucket_width = bucket_width
+        self.buckets = {}  # (time control, bucket) -> OrderedDict of user_id -> QueueEntry
+        self.entries = {}  # user_id -> QueueEntry, in queueing order
+        self.matches = 0
+        self.total_match_wait = 0.0
+
+    def _bucket(self, entry):
+        return (entry.time_control, int(entry.rating) // self.bucket_width)
+
+    def add(self, user_id, rating, time_control, now):
+        """Queue a player; returns an (entry, opponent) pair if someone matches straight away"""
+        self.remove(user_id)
+        entry = QueueEntry(user_id, rating, time_control, now)
+        opponent = self._find(entry, now)
+        if opponent is not None:
+            self._record_match(entry, opponent, now)
+            return entry, opponent
+
+        self.entries[user_id] = entry
+        self.buckets.setdefault(self._bucket(entry), OrderedDict())[user_id] = entry
+        return None
+
+    def remove(self, user_id):
+        """Take a player out of the queue; returns True if they were queued"""
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+        key = self._bucket(entry)
+        bucket = self.buckets[key]
+        del bucket[user_id]
+        if not bucket:
+            del self.buckets[key]
+        return True
+
+    def _find(self, entry, now):
+        """Oldest queued player in the nearest bucket within the entry's window, or None"""
+        window = entry.window(now)
+        time_control, own = self._bucket(entry)
+        reach = int(window) // self.bucket_width + 1
+        for distance in range(reach + 1):
+            for bucket in ((own,) if distance == 0 else (own - distance, own + distance)):
+                waiting = self.buckets.get((time_control, bucket))
+                if not waiting:
+                    continue
+                for other in waiting.values():
+                    if other.user_id != entry.user_id and abs(other.rating - entry.rating) <= window:
+                        self.remove(other.user_id)
+                        return other
+        return None
+
+    def _record_match(self, entry, opponent, now):
+        self.matches += 1
+        self.total_match_wait += (now - entry.enqueued_at) + (now - opponent.enqueued_at)
+
+    def sweep(self, now):
+        """Match players whose windows have widened since they queued; returns (entry, opponent) pairs"""
+        pairs = []
+        for entry in list(self.entries.values()):
+            # Already matched as an earlier player's opponent in this sweep
+            if entry.user_id not in self.entries:
+                continue
+            opponent = self._find(entry, now)
+            if opponent is None:
+                continue
+            self.remove(entry.user_id)
+            self._record_match(entry, opponent, now)
+            pairs.append((entry, opponent))
+        return pairs
+
+    def metrics(self, now):
+        """Queue depth and waiting times, overall and per time control"""
+        queues = {}
+        for entry in self.entries.values():
+            name = f'{entry.time_control[0]}+{entry.time_control[1]}'
+            queue = queues.setdefault(name, {'players': 0, 'totalWait': 0.0, 'longestWaitSeconds': 0.0})
+            waited = now - entry.enqueued_at
+            queue['players'] += 1
+            queue['totalWait'] += waited
+            queue['longestWaitSeconds'] = round(max(queue['longestWaitSeconds'], waited), 1)
+        for queue in queues.values():
+            queue['avgWaitSeconds'] = round(queue.pop('totalWait') / queue['players'], 1)
+
+        return {
+            'queued': len(self.entries),
+            'queues': queues,
+            'matches': self.matches,
+            'avgMatchWaitSeconds': round(self.total_match_wait / (2 * self.matches), 1) if self.matches else 0
+        }
+
+# Queue for this worker process; players are only matched with others on the same worker
+matchmaking_queue = MatchmakingQueue()
@@ -0,0 +1,48 @@
+"""Compact move lists for stored games: 16 bits per move in a BSON binary field.
+
+Each move is packed as from_square | to_square << 6 | promotion << 12, where
+promotion is 0 for none and 1-4 for knight, bishop, rook and queen. The codes
+are stored little-endian, so a game of N plies costs 2 * N bytes.
+"""
+import struct
+import chess
+from bson.binary import Binary
+
+PROMOTION_CODES = {None: 0, chess.KNIGHT: 1, chess.BISHOP: 2, chess.ROOK: 3, chess.QUEEN: 4}
+PROMOTION_PIECES = {code: piece for piece, code in PROMOTION_CODES.items()}
+
+def encode_move(move):
+    return move.from_square | move.to_square << 6 | PROMOTION_CODES[move.promotion] << 12
+
+def decode_move(code):
+    return chess.Move(code & 0x3F, code >> 6 & 0x3F, PROMOTION_PIECES[code >> 12])
+
+def encode_moves(moves):
+    """BSON binary for a sequence of chess.Move"""
+    codes = [encode_move(move) for move in moves]
+    return Binary(struct.pack(f'<{len(codes)}H', *codes))
+
+def move_count(data):
+    if not data:
+        return 0
+    return len(data) if isinstance(data, list) else len(data) // 2
+
+def decode_moves(data, start=0, stop=None):
+    """List of chess.Move from stored moves, optionally only plies start to stop.
+
+    Also accepts the older list-of-UCI-strings format, so documents written
+    before the binary encoding still load.
+    """
+    if not data:
+        return []
+    if isinstance(data, list):
+        return [chess.Move.from_uci(uci) for uci in data[start:stop]]
+    data = data[start * 2:None if stop is None else stop * 2]
+    return [decode_move(code) for code in struct.unpack(f'<{len(data) // 2}H', data)]
+
+def replay(data, start_fen=chess.STARTING_FEN):
+    """Board with the stored moves played from start_fen"""
+    board = chess.Board(start_fen)
+    for move in decode_moves(data):
+        board.push(move)
+    return board
@@ -0,0 +1,244 @@
+import datetime
+import random
+import time
+import chess
+from bson import ObjectId
+from pymongo import UpdateOne
+from database import games_collection
+from move_codec import encode_moves
+from game_replay import snapshots_field
+from opening_explorer import opening_explorer
+from config import (
+    GAME_SNAPSHOT_INTERVAL, MULTIPLAYER_DEFAULT_BASE_SECONDS, MULTIPLAYER_DEFAULT_INCREMENT_SECONDS,
+    MULTIPLAYER_MAX_BASE_SECONDS, MULTIPLAYER_MAX_INCREMENT_SECONDS, MULTIPLAYER_WAITING_TTL
+)
+
+COLORS = {chess.WHITE: 'white', chess.BLACK: 'black'}
+
+def time_control(base_seconds=None, increment_seconds=None):
+    """(base, increment) in seconds, defaulted and clamped to the allowed range"""
+    base_seconds = MULTIPLAYER_DEFAULT_BASE_SECONDS if base_seconds is None else base_seconds
+    increment_seconds = MULTIPLAYER_DEFAULT_INCREMENT_SECONDS if increment_seconds is None else increment_seconds
+    return (
+        max(1, min(int(base_seconds), MULTIPLAYER_MAX_BASE_SECONDS)),
+        max(0, min(int(increment_seconds), MULTIPLAYER_MAX_INCREMENT_SECONDS))
+    )
+
+class MultiplayerGame:
+    """A human-vs-human game with server-authoritative clocks"""
+
+    def __init__(self, game_id, creator_id, creator_color, base_seconds, increment_seconds):
+        self.game_id = game_id
+        self.players = {chess.WHITE: None, chess.BLACK: None}
+        self.players[creator_color] = creator_id
+        self.board = chess.Board()
+        self.snapshots = []  # FENs every GAME_SNAPSHOT_INTERVAL plies, kept as moves are played
+        self.base_ms = base_seconds * 1000
+        self.increment_ms = increment_seconds * 1000
+        self.clocks = {chess.WHITE: self.base_ms, chess.BLACK: self.base_ms}
+        self.turn_started = None  # monotonic time the side to move started thinking
+        self.status = 'waiting'
+        self.result = None
+        self.termination = None
+        self.created_at = datetime.datetime.utcnow()
+        self.waiting_since = time.monotonic()
+        self.version = 1  # bumped on every change; compared with saved_version when flushing
+        self.saved_version = 0
+
+    @property
+    def dirty(self):
+        return self.version != self.saved_version
+
+    def color_of(self, user_id):
+        for color, player in self.players.items():
+            if player == user_id:
+                return color
+        return None
+
+    def start(self, now):
+        self.status = 'playing'
+        self.turn_started = now
+
+    def remaining_ms(self, color, now):
+        """Clock of a side, counting the running time of the side to move"""
+        remaining = self.clocks[color]
+        if self.status == 'playing' and color == self.board.turn:
+            remaining -= int((now - self.turn_started) * 1000)
+        return max(0, remaining)
+
+    def finish(self, result, termination):
+        self.status = 'ended'
+        self.result = result
+        self.termination = termination
+        self.version += 1
+
+    def check_flag(self, now):
+        """End the game if the side to move ran out of time; returns True if it did"""
+        if self.status != 'playing' or self.remaining_ms(self.board.turn, now) > 0:
+            return False
+        loser = self.board.turn
+        self.clocks[loser] = 0
+        # Flagging only loses when the opponent could still mate
+        if self.board.has_insufficient_material(not loser):
+            self.finish('1/2-1/2', 'timeout')
+        else:
+            self.finish('0-1' if loser == chess.WHITE else '1-0', 'timeout')
+        return True
+
+    def play(self, user_id, uci, now):
+        """Validate and apply a player's move; returns an error message or None"""
+        if self.status != 'playing':
+            return 'Game is not in progress'
+        color = self.color_of(user_id)
+        if color is None:
+            return 'Not a player in this game'
+        if color != self.board.turn:
+            return 'Not your turn'
+        if self.check_flag(now):
+            return 'Out of time'
+        try:
+            move = chess.Move.from_uci(uci)
+        except ValueError:
+            return 'Invalid move format'
+        if move not in self.board.legal_moves:
+            return 'Illegal move'
+
+        self.clocks[color] = self.remaining_ms(color, now) + self.increment_ms
+        self.turn_started = now
+        self.board.push(move)
+        if self.board.ply() % GAME_SNAPSHOT_INTERVAL == 0:
+            self.snapshots.append(self.board.fen())
+        self.version += 1
+
+        outcome = self.board.outcome(claim_draw=True)
+        if outcome is not None:
+            self.finish(outcome.result(), outcome.termination.name.lower())
+        return None
+
+    def resign(self, user_id):
+        color = self.color_of(user_id)
+        if color is None or self.status != 'playing':
+            return 'Game is not in progress'
+        self.finish('0-1' if color == chess.WHITE else '1-0', 'resignation')
+        return None
+
+    def state(self, now):
+        """Full game state for a player joining or reconnecting"""
+        return {
+            'gameId': self.game_id,
+            'white': self.players[chess.WHITE],
+            'black': self.players[chess.BLACK],
+            'fen': self.board.fen(),
+            'moves': [move.uci() for move in self.board.move_stack],
+            'whiteMs': self.remaining_ms(chess.WHITE, now),
+            'blackMs': self.remaining_ms(chess.BLACK, now),
+            'baseSeconds': self.base_ms // 1000,
+            'incrementSeconds': self.increment_ms // 1000,
+            'status': self.status,
+            'result': self.result,
+            'termination': self.termination,
+        }
+
+    def move_frame(self, uci, now):
+        """Small broadcast frame for one move"""
+        frame = {
+            'gameId': self.game_id,
+            'move': uci,
+            'ply': self.board.ply(),
+            'whiteMs': self.remaining_ms(chess.WHITE, now),
+            'blackMs': self.remaining_ms(chess.BLACK, now),
+        }
+        if self.status == 'ended':
+            frame.update({'status': self.status, 'result': self.result, 'termination': self.termination})
+        return frame
+
+    def document(self):
+        """Stored fields of the game that change as it is played"""
+        return {
+            'fen': self.board.fen(),
+            'moves': encode_moves(self.board.move_stack),
+            'snapshots': snapshots_field(list(self.snapshots)),
+            'clocks': {'white': self.clocks[chess.WHITE], 'black': self.clocks[chess.BLACK]},
+            'status': self.status,
+            'result': self.result,
+            'termination': self.termination,
+            'updated_at': datetime.datetime.utcnow(),
+        }
+
+    def update(self):
+        """Upsert of the current game state; the packed move list is rewritten whole"""
+        update = {
+            '$set': self.document(),
+            '$setOnInsert': {
+                'game_type': 'multiplayer',
+                'white_id': self.players[chess.WHITE],
+                'black_id': self.players[chess.BLACK],
+                'time_control': {'base': self.base_ms // 1000, 'increment': self.increment_ms // 1000},
+                'created_at': self.created_at,
+            },
+        }
+        return UpdateOne({'_id': ObjectId(self.game_id)}, update, upsert=True)
+
+class MultiplayerGameStore:
+    """Live multiplayer games for this worker, written to MongoDB in batches"""
+
+    def __init__(self):
+        self.games = {}
+
+    def create(self, user_id, color=None, base_seconds=None, increment_seconds=None):
+        if color not in COLORS.values():
+            color = random.choice(list(COLORS.values()))
+        base_seconds, increment_seconds = time_control(base_seconds, increment_seconds)
+
+        game = MultiplayerGame(
+            str(ObjectId()), user_id, chess.WHITE if color == 'white' else chess.BLACK,
+            base_seconds, increment_seconds
+        )
+        self.games[game.game_id] = game
+        return game
+
+    def get(self, game_id):
+        return self.games.get(game_id)
+
+    def join(self, game, user_id, now):
+        """Take the free seat of a waiting game; returns an error message or None"""
+        if game.color_of(user_id) is not None:
+            return None
+        if game.status != 'waiting':
+            return 'Game already started'
+        for color in COLORS:
+            if game.players[color] is None:
+                game.players[color] = user_id
+                break
+        game.start(now)
+        game.version += 1
+        return None
+
+    def check_clocks(self, now):
+        """End games whose side to move has flagged; returns those games"""
+        return [game for game in self.games.values() if game.check_flag(now)]
+
+    def flush(self):
+        """Write all changed games in one bulk write; finished ones go to the opening explorer and leave memory"""
+        now = time.monotonic()
+        changed = [game for game in self.games.values() if game.dirty and game.status != 'waiting']
+        if changed:
+            # Games changed while the write is in flight stay dirty for the next flush
+            versions = [(game, game.version) for game in changed]
+            try:
+                games_collection.bulk_write([game.update() for game in changed], ordered=False)
+            except Exception as e:
+                print(f"Error saving multiplayer games: {e}")
+                return
+            for game, version in versions:
+                game.saved_version = version
+
+        for game in list(self.games.values()):
+            expired = game.status == 'waiting' and now - game.waiting_since > MULTIPLAYER_WAITING_TTL
+            if (game.status == 'ended' and not game.dirty) or expired:
+                del self.games[game.game_id]
+                if game.status == 'ended':
+                    opening_explorer.record_game(game.board.move_stack, game.result)
+
+# Games hosted by this worker process; both players must reach the same worker
+multiplayer_games = MultiplayerGameStore()
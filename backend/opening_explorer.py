@@ -0,0 +1,89 @@
+import time
+import chess
+import chess.polyglot
+from pymongo import UpdateOne
+from chess_ai import ProbeCache
+from move_codec import encode_move, decode_move
+from database import explorer_collection
+from config import EXPLORER_MAX_PLIES, EXPLORER_CACHE_PLIES, EXPLORER_CACHE_SIZE, EXPLORER_CACHE_TTL
+
+# Result fields from the point of view of the side that played the move
+OUTCOME_FIELDS = {'1-0': ('wins', 'losses'), '0-1': ('losses', 'wins'), '1/2-1/2': ('draws', 'draws')}
+
+def position_key(board):
+    """Zobrist hash of a position as a signed 64-bit integer, which MongoDB can store"""
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+class OpeningExplorer:
+    """Per-position move statistics (games, wins, draws, losses), updated as games finish.
+
+    One document per (position, move) in its own collection; positions in the
+    first EXPLORER_CACHE_PLIES plies are served from an in-memory cache.
+    """
+
+    def __init__(self, collection=explorer_collection, cache_size=EXPLORER_CACHE_SIZE):
+        self.collection = collection
+        self.cache = ProbeCache(cache_size)  # position key -> {'loadedAt', 'counts', 'moves'}
+
+    def record_game(self, moves, result, colors=(chess.WHITE, chess.BLACK)):
+        """Add a finished game's opening moves; colors limits it to the human side's moves"""
+        fields = OUTCOME_FIELDS.get(result)
+        if not fields:
+            return
+        board = chess.Board()
+        updates = []
+        for move in moves[:EXPLORER_MAX_PLIES]:
+            if board.turn in colors:
+                key = position_key(board)
+                code = encode_move(move)
+                field = fields[0] if board.turn == chess.WHITE else fields[1]
+                updates.append(UpdateOne(
+                    {'position': key, 'move': code}, {'$inc': {'games': 1, field: 1}}, upsert=True
+                ))
+                self._count(key, code, field)
+            board.push(move)
+
+        if updates:
+            try:
+                self.collection.bulk_write(updates, ordered=False)
+            except Exception as e:
+                print(f"Error updating opening explorer: {e}")
+
+    def _count(self, key, code, field):
+        """Apply a game to a cached position so this worker sees it before the cache expires"""
+        entry = self.cache.get(key)
+        if entry is None:
+            return
+        counts = entry['counts'].setdefault(code, {'games': 0, 'wins': 0, 'draws': 0, 'losses': 0})
+        counts['games'] += 1
+        counts[field] += 1
+        entry['moves'] = None
+
+    def lookup(self, board):
+        """Moves played from this position with their results, most played first"""
+        cacheable = board.ply() <= EXPLORER_CACHE_PLIES
+        key = position_key(board)
+        entry = self.cache.get(key) if cacheable else None
+        if entry is None or time.monotonic() - entry['loadedAt'] > EXPLORER_CACHE_TTL:
+            counts = {
+                document['move']: {name: document.get(name, 0) for name in ('games', 'wins', 'draws', 'losses')}
+                for document in self.collection.find({'position': key})
+            }
+            entry = {'loadedAt': time.monotonic(), 'counts': counts, 'moves': None}
+            if cacheable:
+                self.cache.put(key, entry)
+
+        if entry['moves'] is None:
+            moves = []
+            for code, counts in entry['counts'].items():
+                move = decode_move(code)
+                # Guard against hash collisions with another position
+                if move in board.legal_moves:
+                    moves.append({'move': move.uci(), 'san': board.san(move), **counts})
+            moves.sort(key=lambda item: item['games'], reverse=True)
+            entry['moves'] = moves
+        return entry['moves']
+
+# One explorer (and hot cache) per web worker process
+opening_explorer = OpeningExplorer()
@@ -1,10 +1,191 @@
-from flask import Blueprint, request, jsonify
+import json
+import time
+from flask import Blueprint, Response, request, jsonify
 from utils import token_required
-from chess_ai import ChessAI
+from engine_pool import engine_pool, EngineTimeout
+from engine_stats import search_histogram
+from search_cache import result_cache
+from game_sessions import game_sessions, game_status, captured_piece_symbol
+from game_review import review_moves
+from game_replay import seek, iter_positions
+from multiplayer import multiplayer_games
+from move_codec import move_count
+from opening_explorer import opening_explorer
+from matchmaking import matchmaking_queue
+from database import games_collection
+from bson import ObjectId
+from config import (
+    AI_MOVE_TIME_MS, AI_MAX_MOVE_TIME_MS, DEFAULT_AI_DIFFICULTY, AI_ANALYSIS_TIME_MS, AI_ANALYSIS_MAX_LINES,
+    AI_PONDER_ENABLED
+)
 import chess
 
 chess_bp = Blueprint('chess', __name__)
 
+@chess_bp.route('/new-game', methods=['POST'])
+@token_required
+def new_game(current_user):
+    """Start a server-side game against the AI"""
+    try:
+        data = request.get_json(silent=True) or {}
+        difficulty = data.get('difficulty', DEFAULT_AI_DIFFICULTY)
+        ponder = bool(data.get('ponder', AI_PONDER_ENABLED)) and AI_PONDER_ENABLED
+        
+        session = game_sessions.create(current_user['_id'], difficulty, ponder)
+        
+        return jsonify({
+            'gameId': session.game_id,
+            'fen': session.board.fen(),
+            'difficulty': session.difficulty,
+            'ponder': session.ponder,
+            'isPlayerTurn': True,
+            'gameStatus': 'playing'
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to start game: {str(e)}'}), 500
+
+def parse_time_budget(data, default=AI_MOVE_TIME_MS):
+    """Per-request search time, capped so one client can't hog the engine workers"""
+    time_budget_ms = int(data.get('time_budget_ms', default))
+    return max(1, min(time_budget_ms, AI_MAX_MOVE_TIME_MS))
+
+def load_board(data, user_id, turn):
+    """Return (session, board, error) for a request, using the live session board when game_id is given"""
+    game_id = data.get('game_id')
+    if not game_id:
+        # Stateless play: build the board from the client's FEN
+        return None, chess.Board(data.get('fen', chess.STARTING_FEN)), None
+    
+    session = game_sessions.get(game_id, user_id)
+    if not session:
+        return None, None, ({'error': 'Game not found'}, 404)
+    if game_status(session.board)[0] == 'ended':
+        return None, None, ({'error': 'Game is over'}, 400)
+    if session.board.turn != turn:
+        return None, None, ({'error': 'Not your turn' if turn == chess.WHITE else 'Not the AI\'s turn'}, 400)
+    return session, session.board, None
+
+def apply_player_move(board, move_str):
+    """Validate and push the player's move; returns (captured piece, error)"""
+    try:
+        move = chess.Move.from_uci(move_str)
+        if move not in board.legal_moves:
+            return None, ({'error': 'Illegal move'}, 400)
+    except ValueError:
+        return None, ({'error': 'Invalid move format'}, 400)
+    
+    captured_piece = captured_piece_symbol(board, move)
+    board.push(move)
+    return captured_piece, None
+
+def close_session(session):
+    """Save a finished game and stop any pondering on it"""
+    engine_pool.cancel_ponder(session.game_id)
+    game_sessions.close(session)
+
+def start_ponder(session, board, search_stats, difficulty):
+    """Ponder on the position after the reply the AI's principal variation predicts"""
+    pv = (search_stats or {}).get('pv') or []
+    if not session or not session.ponder or len(pv) < 2:
+        return
+    predicted = chess.Move.from_uci(pv[1])
+    if predicted not in board.legal_moves:
+        return
+    board.push(predicted)
+    fen = board.fen()
+    board.pop()
+    engine_pool.ponder(session.game_id, fen, difficulty)
+
+def apply_ai_move(board, difficulty, time_budget_ms, session=None):
+    """Search and push the AI's reply; returns (move, captured piece, search stats, error)"""
+    ply = board.ply()
+    
+    # A correct prediction has already been searched while the player was thinking
+    result = engine_pool.take_ponder(session.game_id, board.fen(), time_budget_ms) if session else None
+    try:
+        if result is None:
+            result = engine_pool.get_best_move(board.fen(), difficulty, time_budget_ms)
+    except EngineTimeout as e:
+        return None, None, None, ({'error': f'AI move unavailable: {str(e)}'}, 503)
+    ai_move_uci, search_stats = result
+    
+    if not ai_move_uci:
+        return None, None, None, ({'error': 'No legal moves available'}, 400)
+    
+    # Another request may have moved on this game while the engine was thinking
+    if board.ply() != ply:
+        return None, None, None, ({'error': 'Game changed during AI move'}, 409)
+    
+    ai_move = chess.Move.from_uci(ai_move_uci)
+    captured_piece = captured_piece_symbol(board, ai_move)
+    board.push(ai_move)
+    if game_status(board)[0] == 'playing':
+        start_ponder(session, board, search_stats, difficulty)
+    return ai_move, captured_piece, search_stats, None
+
+def play_turn(user_id, data):
+    """Player move plus AI reply on one board; returns (response, status code)"""
+    move_str = data.get('move')
+    if not move_str:
+        return {'error': 'Move is required'}, 400
+    
+    try:
+        time_budget_ms = parse_time_budget(data)
+    except (TypeError, ValueError):
+        return {'error': 'Invalid time budget'}, 400
+    
+    session, board, error = load_board(data, user_id, chess.WHITE)
+    if error:
+        return error
+    
+    captured_piece, error = apply_player_move(board, move_str)
+    if error:
+        return error
+    
+    response = {
+        'move': move_str,
+        'capturedPiece': captured_piece,
+        'aiMove': None,
+        'aiCapturedPiece': None
+    }
+    
+    # Only ask the engine for a reply if the player's move didn't end the game
+    status, result = game_status(board)
+    if status == 'playing':
+        difficulty = data.get('difficulty', session.difficulty if session else DEFAULT_AI_DIFFICULTY)
+        ply = board.ply()
+        ai_move, ai_captured_piece, search_stats, error = apply_ai_move(board, difficulty, time_budget_ms, session)
+        if error:
+            # Take the player's move back so the same request can be retried, unless
+            # another request has moved on since; either way report the board as it is now
+            body, code = error
+            if board.ply() == ply:
+                board.pop()
+            body.update({'fen': board.fen(), 'isPlayerTurn': board.turn == chess.WHITE})
+            if session:
+                body['gameId'] = session.game_id
+            return body, code
+        response['aiMove'] = ai_move.uci()
+        response['aiCapturedPiece'] = ai_captured_piece
+        if data.get('include_stats'):
+            response['searchStats'] = search_stats
+        status, result = game_status(board)
+    
+    if session and status == 'ended':
+        close_session(session)
+    
+    response.update({
+        'fen': board.fen(),
+        'isPlayerTurn': board.turn == chess.WHITE and status == 'playing',
+        'gameStatus': status,
+        'result': result,
+        'isCheck': board.is_check()
+    })
+    if session:
+        response['gameId'] = session.game_id
+    return response, 200
+
 @chess_bp.route('/make-move', methods=['POST'])
 @token_required
 def make_move(current_user):
@@ -12,56 +193,36 @@ def make_move(current_user):
     try:
         data = request.get_json()
         move_str = data.get('move')
-        fen = data.get('fen', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
         
         if not move_str:
             return jsonify({'error': 'Move is required'}), 400
         
-        # Create board from FEN
-        board = chess.Board(fen)
+        session, board, error = load_board(data, current_user['_id'], chess.WHITE)
+        if error:
+            return jsonify(error[0]), error[1]
         
-        # Check if move captures a piece
-        captured_piece = None
-        if board.is_capture(chess.Move.from_uci(move_str)):
-            target_square = chess.Move.from_uci(move_str).to_square
-            if board.is_en_passant(chess.Move.from_uci(move_str)):
-                captured_piece = 'p'  # En passant always captures a pawn
-            else:
-                piece_at_target = board.piece_at(target_square)
-                if piece_at_target:
-                    captured_piece = piece_at_target.symbol()
-        
-        # Parse and validate move
-        try:
-            move = chess.Move.from_uci(move_str)
-            if move not in board.legal_moves:
-                return jsonify({'error': 'Illegal move'}), 400
-        except ValueError:
-            return jsonify({'error': 'Invalid move format'}), 400
-        
-        # Make the move
-        board.push(move)
+        captured_piece, error = apply_player_move(board, move_str)
+        if error:
+            return jsonify(error[0]), error[1]
         
         # Check game status
-        game_status = "playing"
-        result = None
-        
-        if board.is_checkmate():
-            game_status = "ended"
-            result = "win" if board.turn == chess.BLACK else "loss"
-        elif board.is_stalemate() or board.is_insufficient_material():
-            game_status = "ended"
-            result = "draw"
+        status, result = game_status(board)
+        if session and status == 'ended':
+            close_session(session)
         
-        return jsonify({
+        response = {
             'fen': board.fen(),
             'isPlayerTurn': False,
-            'gameStatus': game_status,
+            'gameStatus': status,
             'result': result,
             'isCheck': board.is_check(),
             'move': move_str,
             'capturedPiece': captured_piece
-        }), 200
+        }
+        if session:
+            response['gameId'] = session.game_id
+        
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({'error': f'Failed to make move: {str(e)}'}), 500
@@ -72,55 +233,277 @@ def ai_move(current_user):
     """Get AI move"""
     try:
         data = request.get_json()
-        fen = data.get('fen', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
-        difficulty = data.get('difficulty', 3)
-        
-        # Create board from FEN
-        board = chess.Board(fen)
-        
-        # Initialize AI
-        ai = ChessAI(difficulty)
         
-        # Get AI move
-        ai_move = ai.get_best_move(board)
-        
-        if not ai_move:
-            return jsonify({'error': 'No legal moves available'}), 400
+        try:
+            time_budget_ms = parse_time_budget(data)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid time budget'}), 400
         
-        # Check if AI move captures a piece
-        captured_piece = None
-        if board.is_capture(ai_move):
-            target_square = ai_move.to_square
-            if board.is_en_passant(ai_move):
-                captured_piece = 'P'  # En passant always captures a pawn (uppercase for white)
-            else:
-                piece_at_target = board.piece_at(target_square)
-                if piece_at_target:
-                    captured_piece = piece_at_target.symbol()
+        session, board, error = load_board(data, current_user['_id'], chess.BLACK)
+        if error:
+            return jsonify(error[0]), error[1]
+        difficulty = data.get('difficulty', session.difficulty if session else DEFAULT_AI_DIFFICULTY)
         
-        # Make the AI move
-        board.push(ai_move)
+        # Get AI move from an engine worker process
+        ai_move, captured_piece, search_stats, error = apply_ai_move(board, difficulty, time_budget_ms, session)
+        if error:
+            return jsonify(error[0]), error[1]
         
         # Check game status
-        game_status = "playing"
-        result = None
-        
-        if board.is_checkmate():
-            game_status = "ended"
-            result = "loss" if board.turn == chess.WHITE else "win"
-        elif board.is_stalemate() or board.is_insufficient_material():
-            game_status = "ended"
-            result = "draw"
+        status, result = game_status(board)
+        if session and status == 'ended':
+            close_session(session)
         
-        return jsonify({
+        response = {
             'fen': board.fen(),
             'isPlayerTurn': True,
-            'gameStatus': game_status,
+            'gameStatus': status,
             'result': result,
             'isCheck': board.is_check(),
             'aiMove': ai_move.uci(),
             'capturedPiece': captured_piece
-        }), 200
+        }
+        if session:
+            response['gameId'] = session.game_id
+        if data.get('include_stats'):
+            response['searchStats'] = search_stats
+        
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({'error': f'Failed to get AI move: {str(e)}'}), 500
+
+@chess_bp.route('/play-move', methods=['POST'])
+@token_required
+def play_move(current_user):
+    """Player move and AI reply in a single request"""
+    try:
+        data = request.get_json()
+        response, status_code = play_turn(current_user['_id'], data)
+        return jsonify(response), status_code
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to play move: {str(e)}'}), 500
+
+@chess_bp.route('/engine-stats', methods=['GET'])
+@token_required
+def engine_stats(current_user):
+    """Aggregated AI search statistics for this worker process"""
+    try:
+        return jsonify({
+            'stats': search_histogram.snapshot(),
+            'resultCache': {
+                'hits': result_cache.hits,
+                'misses': result_cache.misses,
+                'size': len(result_cache.memory.entries)
+            }
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to get engine stats: {str(e)}'}), 500
+
+@chess_bp.route('/analyze', methods=['POST'])
+@token_required
+def analyze(current_user):
+    """Top candidate moves for a position with scores and principal variations"""
+    try:
+        data = request.get_json()
+        
+        try:
+            board = chess.Board(data.get('fen', chess.STARTING_FEN))
+        except ValueError:
+            return jsonify({'error': 'Invalid FEN'}), 400
+        if not board.is_valid():
+            return jsonify({'error': 'Invalid position'}), 400
+        
+        try:
+            time_budget_ms = parse_time_budget(data, AI_ANALYSIS_TIME_MS)
+            multipv = max(1, min(int(data.get('multipv', 3)), AI_ANALYSIS_MAX_LINES))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid analysis options'}), 400
+        
+        try:
+            lines, search_stats = engine_pool.analyze(board.fen(), multipv, time_budget_ms)
+        except EngineTimeout as e:
+            return jsonify({'error': f'Analysis unavailable: {str(e)}'}), 503
+        
+        for line in lines:
+            line['san'] = board.san(chess.Move.from_uci(line['move']))
+        
+        response = {
+            'fen': board.fen(),
+            'depth': search_stats['depth'],
+            'lines': lines
+        }
+        if data.get('include_stats'):
+            response['searchStats'] = search_stats
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to analyze position: {str(e)}'}), 500
+
+@chess_bp.route('/review-game', methods=['POST'])
+@token_required
+def review_game(current_user):
+    """Classify every move of a game; reviews of saved games are stored on the game"""
+    try:
+        data = request.get_json() or {}
+        game_id = data.get('game_id')
+        session = None
+        
+        if game_id:
+            session = game_sessions.get(game_id, current_user['_id'])
+            if not session:
+                return jsonify({'error': 'Game not found'}), 404
+            moves = list(session.board.move_stack)
+        else:
+            board = chess.Board()
+            moves = []
+            try:
+                for uci in data.get('moves', []):
+                    move = chess.Move.from_uci(uci)
+                    if move not in board.legal_moves:
+                        return jsonify({'error': f'Illegal move: {uci}'}), 400
+                    board.push(move)
+                    moves.append(move)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid move format'}), 400
+        
+        if not moves:
+            return jsonify({'error': 'Game has no moves to review'}), 400
+        
+        try:
+            review = review_moves(moves)
+        except EngineTimeout as e:
+            return jsonify({'error': f'Review unavailable: {str(e)}'}), 503
+        
+        if session:
+            game_sessions.save_review(session, review)
+        
+        return jsonify({'gameId': game_id, 'review': review}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to review game: {str(e)}'}), 500
+
+@chess_bp.route('/review-game/<game_id>', methods=['GET'])
+@token_required
+def get_game_review(current_user, game_id):
+    """Stored review of one of the user's games"""
+    try:
+        if not ObjectId.is_valid(game_id):
+            return jsonify({'error': 'Game not found'}), 404
+        
+        game = games_collection.find_one(
+            {'_id': ObjectId(game_id), 'user_id': current_user['_id']}, {'review': 1}
+        )
+        if not game:
+            return jsonify({'error': 'Game not found'}), 404
+        if not game.get('review'):
+            return jsonify({'error': 'Game has not been reviewed'}), 404
+        
+        return jsonify({'gameId': game_id, 'review': game['review']}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to fetch game review: {str(e)}'}), 500
+
+def load_game(game_id, user_id):
+    """Moves and snapshots of one of the user's games, live or stored, or None"""
+    session = game_sessions.get(game_id, user_id)
+    if session:
+        return session.to_document()
+    
+    game = multiplayer_games.get(game_id)
+    if game and game.color_of(str(user_id)) is not None:
+        return game.document()
+    
+    if not ObjectId.is_valid(game_id):
+        return None
+    player = str(user_id)
+    return games_collection.find_one(
+        {'_id': ObjectId(game_id), '$or': [{'user_id': user_id}, {'white_id': player}, {'black_id': player}]},
+        {'moves': 1, 'snapshots': 1}
+    )
+
+@chess_bp.route('/games/<game_id>/position', methods=['GET'])
+@token_required
+def get_game_position(current_user, game_id):
+    """Position at a ply of a game (the final position by default)"""
+    try:
+        game = load_game(game_id, current_user['_id'])
+        if not game:
+            return jsonify({'error': 'Game not found'}), 404
+        
+        plies = move_count(game.get('moves'))
+        try:
+            ply = int(request.args.get('ply', plies))
+        except ValueError:
+            return jsonify({'error': 'Invalid ply'}), 400
+        if ply < 0 or ply > plies:
+            return jsonify({'error': f'Ply must be between 0 and {plies}'}), 400
+        
+        board = seek(game, ply)
+        return jsonify({
+            'gameId': game_id,
+            'ply': ply,
+            'plies': plies,
+            'fen': board.fen(),
+            'lastMove': board.peek().uci() if board.move_stack else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to fetch game position: {str(e)}'}), 500
+
+@chess_bp.route('/games/<game_id>/positions', methods=['GET'])
+@token_required
+def get_game_positions(current_user, game_id):
+    """Every position of a game, streamed as one JSON object per line"""
+    try:
+        game = load_game(game_id, current_user['_id'])
+        if not game:
+            return jsonify({'error': 'Game not found'}), 404
+        
+        def generate():
+            for position in iter_positions(game):
+                yield json.dumps(position) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to fetch game positions: {str(e)}'}), 500
+
+@chess_bp.route('/explorer', methods=['GET'])
+@token_required
+def explorer(current_user):
+    """Moves played from a position (fen, or moves from the start) and their results"""
+    try:
+        try:
+            if request.args.get('moves'):
+                board = chess.Board()
+                for uci in request.args['moves'].split(','):
+                    move = chess.Move.from_uci(uci)
+                    if move not in board.legal_moves:
+                        return jsonify({'error': f'Illegal move: {uci}'}), 400
+                    board.push(move)
+            else:
+                board = chess.Board(request.args.get('fen', chess.STARTING_FEN))
+        except ValueError:
+            return jsonify({'error': 'Invalid position'}), 400
+        
+        moves = opening_explorer.lookup(board)
+        return jsonify({
+            'fen': board.fen(),
+            'games': sum(move['games'] for move in moves),
+            'moves': moves
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to fetch explorer stats: {str(e)}'}), 500
+
+@chess_bp.route('/matchmaking-stats', methods=['GET'])
+@token_required
+def matchmaking_stats(current_user):
+    """Queue depth and waiting times of this worker's matchmaking queue"""
+    try:
+        return jsonify(matchmaking_queue.metrics(time.monotonic())), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to fetch matchmaking stats: {str(e)}'}), 500
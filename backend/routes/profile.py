@@ -180,15 +180,15 @@ def get_game_history(current_user):
         limit = int(request.args.get('limit', 20))
         skip = (page - 1) * limit
         
-        games = list(games_collection.find(
-            {'user_id': current_user['_id']}
-        ).sort('played_at', -1).skip(skip).limit(limit))
+        # Saved server-side game sessions aren't part of the rated history
+        history_filter = {'user_id': current_user['_id'], 'session': {'$ne': True}}
+        games = list(games_collection.find(history_filter).sort('played_at', -1).skip(skip).limit(limit))
         
         for game in games:
             game['_id'] = str(game['_id'])
             game['user_id'] = str(game['user_id'])
         
-        total_games = games_collection.count_documents({'user_id': current_user['_id']})
+        total_games = games_collection.count_documents(history_filter)
         
         return jsonify({
             'games': games,
@@ -252,7 +252,7 @@ def export_game_data(current_user):
         profile = profiles_collection.find_one({'user_id': current_user['_id']})
         
         # Get user's games
-        games = list(games_collection.find({'user_id': current_user['_id']}))
+        games = list(games_collection.find({'user_id': current_user['_id'], 'session': {'$ne': True}}))
         
         # Get achievements
         achievements = profile.get('achievements', []) if profile else []
@@ -0,0 +1,88 @@
+import datetime
+import chess
+from chess_ai import ChessAI, ProbeCache
+from config import AI_DIFFICULTY_LEVELS, AI_RESULT_CACHE_SIZE, AI_RESULT_CACHE_PERSIST
+
+def cache_key(fen, difficulty):
+    """Position without move clocks (and en passant only when legal) plus the difficulty"""
+    return f'{chess.Board(fen).epd(en_passant="legal")}|{difficulty}'
+
+def full_depth(difficulty):
+    """Depth a search must reach before its result stands in for a fresh one"""
+    return AI_DIFFICULTY_LEVELS[difficulty]['max_depth']
+
+class SearchResultCache:
+    """Finished search results by (normalized FEN, difficulty), in an LRU with an optional MongoDB tier.
+
+    Entries keep the top root lines rather than one move, so weaker levels
+    still sample a move from them on every hit. Only searches that reached the
+    level's full depth are kept; a result cut short by a small time budget
+    would otherwise be served to requests that have time for a real search.
+    """
+
+    def __init__(self, size=AI_RESULT_CACHE_SIZE, collection=None):
+        self.memory = ProbeCache(size)
+        self.collection = collection  # optional persistent tier with a TTL index
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fen, difficulty):
+        """Cached full-depth {'lines', 'depth'} for the position, or None"""
+        key = cache_key(fen, difficulty)
+        entry = self.memory.get(key)
+        if entry is None and self.collection is not None:
+            try:
+                document = self.collection.find_one({'_id': key})
+            except Exception as e:
+                print(f"Error reading engine cache: {e}")
+                document = None
+            if document:
+                entry = {'lines': document['lines'], 'depth': document['depth']}
+                self.memory.put(key, entry)
+
+        # Shallow entries can predate the depth check, e.g. in the MongoDB tier
+        if entry is not None and entry['depth'] < full_depth(difficulty):
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, fen, difficulty, lines, depth):
+        """Remember a full-depth search result unless a deeper one is already cached"""
+        if not lines or depth < full_depth(difficulty):
+            return
+        key = cache_key(fen, difficulty)
+        existing = self.memory.get(key)
+        if existing is not None and existing['depth'] > depth:
+            return
+        self.memory.put(key, {'lines': lines, 'depth': depth})
+
+        if self.collection is not None:
+            try:
+                self.collection.update_one(
+                    {'_id': key, 'depth': {'$lte': depth}},
+                    {'$set': {'lines': lines, 'depth': depth, 'created_at': datetime.datetime.utcnow()}},
+                    upsert=True
+                )
+            except Exception as e:
+                # Duplicate key: a deeper result is already stored
+                if 'E11000' not in str(e):
+                    print(f"Error writing engine cache: {e}")
+
+    def choose(self, entry, difficulty):
+        """A move from a cached entry, sampled like a fresh search at this difficulty"""
+        level = AI_DIFFICULTY_LEVELS[difficulty]
+        return ChessAI.choose_move(entry['lines'][:level['multipv']], level['max_loss'])
+
+def create_result_cache():
+    collection = None
+    if AI_RESULT_CACHE_PERSIST:
+        from database import engine_cache_collection
+        collection = engine_cache_collection
+    return SearchResultCache(collection=collection)
+
+# One cache per web worker process; the MongoDB tier is shared between them
+result_cache = create_result_cache()
@@ -0,0 +1,203 @@
+"""UCI frontend for ChessAI, so the engine can run as a standalone process.
+
+    python uci.py
+
+Works with any UCI GUI or tournament manager, and with uci_engine.py to
+drive it from the web workers like an external engine.
+"""
+import sys
+import threading
+import time
+import types
+import chess
+from chess_ai import ChessAI, MATE_SCORE, MAX_PLY
+
+ENGINE_NAME = 'Oops Checkmate'
+ENGINE_AUTHOR = 'Oops Checkmate developers'
+
+# Iterative deepening limit when the GUI gives only a clock
+UCI_MAX_DEPTH = 64
+INFINITE_TIME_MS = 24 * 60 * 60 * 1000
+
+def time_budget_ms(board, params):
+    """Milliseconds to spend on this move from the go command's clock parameters"""
+    if 'movetime' in params:
+        return max(1, params['movetime'] - 20)
+    clock = params.get('wtime' if board.turn == chess.WHITE else 'btime')
+    if clock is None:
+        return INFINITE_TIME_MS
+    increment = params.get('winc' if board.turn == chess.WHITE else 'binc', 0)
+    moves_to_go = params.get('movestogo', 30)
+    budget = clock / max(1, moves_to_go) + increment * 3 / 4
+    return max(1, int(min(budget, clock / 2)))
+
+def format_score(score):
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        plies = MATE_SCORE - abs(score)
+        return f'mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}'
+    return f'cp {score}'
+
+class UciEngine:
+    """Reads UCI commands from stdin and answers on stdout"""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = chess.Board()
+        self.difficulty = 5
+        self.own_book = False
+        self.stop_flag = types.SimpleNamespace(value=0)
+        self.search_thread = None
+        self.stopped = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def handle(self, line):
+        """Process one command; returns False on quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            self.send('option name Difficulty type spin default 5 min 1 max 5')
+            self.send('option name OwnBook type check default false')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.wait_for_search()
+            self.board = chess.Board()
+        elif command == 'position':
+            self.wait_for_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.wait_for_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_flag.value = 1
+            self.stopped.set()
+            self.wait_for_search()
+        elif command == 'quit':
+            self.stop_flag.value = 1
+            self.stopped.set()
+            self.wait_for_search()
+            return False
+        return True
+
+    def set_option(self, args):
+        text = ' '.join(args)
+        if not text.startswith('name ') or ' value ' not in text:
+            return
+        name, value = text[5:].split(' value ', 1)
+        name = name.strip().lower()
+        if name == 'difficulty':
+            try:
+                self.difficulty = max(1, min(5, int(value)))
+            except ValueError:
+                pass
+        elif name == 'ownbook':
+            self.own_book = value.strip().lower() == 'true'
+
+    def set_position(self, args):
+        if not args:
+            return
+        if args[0] == 'startpos':
+            board = chess.Board()
+            rest = args[1:]
+        elif args[0] == 'fen':
+            fen_fields = []
+            rest = args[1:]
+            while rest and rest[0] != 'moves':
+                fen_fields.append(rest.pop(0))
+            try:
+                board = chess.Board(' '.join(fen_fields))
+            except ValueError:
+                return
+        else:
+            return
+
+        if rest and rest[0] == 'moves':
+            for uci in rest[1:]:
+                try:
+                    board.push_uci(uci)
+                except ValueError:
+                    break
+        self.board = board
+
+    def go(self, args):
+        params = {}
+        infinite = False
+        index = 0
+        while index < len(args):
+            name = args[index]
+            if name == 'infinite':
+                infinite = True
+                index += 1
+            elif name == 'ponder':
+                index += 1
+            elif index + 1 < len(args):
+                try:
+                    params[name] = int(args[index + 1])
+                except ValueError:
+                    pass
+                index += 2
+            else:
+                index += 1
+
+        budget = INFINITE_TIME_MS if infinite else time_budget_ms(self.board, params)
+        max_depth = params.get('depth')
+        if max_depth is None and self.difficulty == 5:
+            max_depth = UCI_MAX_DEPTH
+
+        self.stop_flag.value = 0
+        self.stopped.clear()
+        self.search_thread = threading.Thread(
+            target=self.search, args=(self.board.copy(), budget, max_depth, infinite), daemon=True
+        )
+        self.search_thread.start()
+
+    def search(self, board, budget, max_depth, infinite):
+        ai = ChessAI(self.difficulty)
+        ai.use_book = self.own_book
+        ai.stop_flag = self.stop_flag
+        ai.on_iteration = self.send_info
+        move = ai.get_best_move(board, budget, max_depth)
+
+        # In infinite mode the GUI expects bestmove only after it sends stop
+        if infinite:
+            self.stopped.wait()
+        self.send(f'bestmove {move.uci() if move else "0000"}')
+
+    def send_info(self, ai):
+        if not ai.root_lines:
+            return
+        elapsed_ms = int((time.monotonic() - ai.start_time) * 1000)
+        nps = int(ai.nodes * 1000 / elapsed_ms) if elapsed_ms > 0 else 0
+        pv = ' '.join(move.uci() for move in ai.pv)
+        self.send(
+            f'info depth {ai.completed_depth} score {format_score(ai.root_lines[0][1])} '
+            f'nodes {ai.nodes} nps {nps} time {elapsed_ms} pv {pv}'
+        )
+
+    def wait_for_search(self):
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+def main():
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line.strip()):
+            break
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import shlex
+import time
+import chess
+import chess.engine
+from eventlet import tpool
+from eventlet.queue import LightQueue, Empty
+from chess_ai import MATE_SCORE
+from engine_pool import EngineTimeout
+from engine_stats import search_histogram
+from config import (
+    AI_EXTERNAL_ENGINE, AI_EXTERNAL_ENGINE_POOL_SIZE, AI_EXTERNAL_ENGINE_ELO,
+    AI_MOVE_TIME_MS, ENGINE_POOL_TIMEOUT_GRACE_MS
+)
+
+# Stockfish-style skill levels (0-20) for engines without UCI_Elo
+SKILL_LEVELS = {1: 0, 2: 5, 3: 10, 4: 15, 5: 20}
+
+def strength_options(engine, difficulty):
+    """UCI options that make the engine play at roughly this difficulty"""
+    options = engine.options
+    elo = AI_EXTERNAL_ENGINE_ELO.get(difficulty)
+    if 'UCI_LimitStrength' in options and 'UCI_Elo' in options:
+        if elo is None:
+            return {'UCI_LimitStrength': False}
+        option = options['UCI_Elo']
+        return {'UCI_LimitStrength': True, 'UCI_Elo': max(option.min, min(option.max, elo))}
+    if 'Difficulty' in options:
+        return {'Difficulty': difficulty}
+    if 'Skill Level' in options:
+        return {'Skill Level': SKILL_LEVELS[difficulty]}
+    return {}
+
+class ExternalEnginePool:
+    """Long-lived UCI engine processes driven through chess.engine.
+
+    chess.engine's blocking API runs in eventlet's thread pool so a search
+    never stalls the web worker's hub.
+    """
+
+    def __init__(self, command=AI_EXTERNAL_ENGINE, size=AI_EXTERNAL_ENGINE_POOL_SIZE):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.size = size
+        self.idle = LightQueue()
+        self.engines = []
+        self.started = False
+
+    def _open(self):
+        return chess.engine.SimpleEngine.popen_uci(self.command)
+
+    def start(self):
+        """Start the engine processes (safe to call more than once)"""
+        if self.started:
+            return
+        self.started = True
+        for _ in range(self.size):
+            engine = tpool.execute(self._open)
+            self.engines.append(engine)
+            self.idle.put(engine)
+
+    def stop(self):
+        for engine in self.engines:
+            try:
+                engine.quit()
+            except Exception:
+                engine.close()
+        self.engines = []
+        self.idle = LightQueue()
+        self.started = False
+
+    def _replace(self, engine):
+        """Close a crashed or stuck engine and start a fresh one in its place"""
+        try:
+            engine.close()
+        except Exception:
+            pass
+        replacement = tpool.execute(self._open)
+        self.engines = [replacement if e is engine else e for e in self.engines]
+        return replacement
+
+    def _play(self, engine, board, difficulty, time_budget_ms):
+        return engine.play(
+            board, chess.engine.Limit(time=time_budget_ms / 1000.0),
+            info=chess.engine.INFO_ALL, options=strength_options(engine, difficulty)
+        )
+
+    def get_best_move(self, fen, difficulty, time_budget_ms=AI_MOVE_TIME_MS):
+        """Same contract as EnginePool.get_best_move: returns (UCI move, search stats)"""
+        self.start()
+        timeout = (time_budget_ms + ENGINE_POOL_TIMEOUT_GRACE_MS) / 1000.0
+        try:
+            engine = self.idle.get(timeout=timeout)
+        except Empty:
+            raise EngineTimeout('All external engines are busy')
+
+        board = chess.Board(fen)
+        start = time.monotonic()
+        try:
+            result = tpool.execute(self._play, engine, board, difficulty, time_budget_ms)
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError, TimeoutError) as e:
+            search_histogram.record_timeout()
+            self.idle.put(self._replace(engine))
+            raise EngineTimeout(f'External engine failed: {e}')
+        self.idle.put(engine)
+
+        elapsed_ms = (time.monotonic() - start) * 1000.0
+        info = result.info
+        nodes = info.get('nodes', 0)
+        score = info.get('score')
+        stats = {
+            'difficulty': difficulty,
+            'source': 'external',
+            'nodes': nodes,
+            'qnodes': 0,
+            'ttHits': 0,
+            'betaCutoffs': 0,
+            'firstMoveCutoffs': 0,
+            'depth': info.get('depth', 0),
+            'elapsedMs': round(elapsed_ms, 2),
+            'nps': info.get('nps', int(nodes * 1000 / elapsed_ms) if elapsed_ms > 0 else 0),
+            'pv': [move.uci() for move in info.get('pv', [])],
+            'lines': [],
+        }
+        if result.move is not None and score is not None:
+            stats['lines'] = [[result.move.uci(), score.relative.score(mate_score=MATE_SCORE)]]
+        search_histogram.record(stats)
+        return (result.move.uci() if result.move else None), stats
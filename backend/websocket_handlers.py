@@ -4,11 +4,19 @@ import threading
 import jwt
 from flask_socketio import emit, join_room, leave_room
 from flask import request
-from config import SECRET_KEY, CLEANUP_INTERVAL, USER_INACTIVITY_TIMEOUT
-from database import users_collection, messages_collection, chat_rooms_collection
+from config import (
+    SECRET_KEY, CLEANUP_INTERVAL, USER_INACTIVITY_TIMEOUT, MULTIPLAYER_FLUSH_INTERVAL, MULTIPLAYER_CLOCK_INTERVAL,
+    MATCHMAKING_SWEEP_INTERVAL
+)
+from database import users_collection, messages_collection, chat_rooms_collection, profiles_collection
+from bson import ObjectId
+from routes.chess import play_turn
+from multiplayer import multiplayer_games, time_control
+from matchmaking import matchmaking_queue
 
 # Online users tracking
 online_users = {}  # {user_id: {'socket_id': socket_id, 'last_seen': timestamp}}
+socket_users = {}  # {socket_id: user_id} for sockets that have sent user_login
 
 def handle_connect(socketio):
     """Handle client connection"""
@@ -29,6 +37,9 @@ def handle_connect(socketio):
 def handle_disconnect(socketio):
     """Handle client disconnection"""
     print(f"Client disconnected: {request.sid}")
+    socket_user = socket_users.pop(request.sid, None)
+    if socket_user:
+        matchmaking_queue.remove(socket_user)
     # Remove user from online users
     user_id = None
     for uid, data in online_users.items():
@@ -57,6 +68,7 @@ def handle_user_login(socketio, data):
             'socket_id': request.sid,
             'last_seen': datetime.datetime.utcnow()
         }
+        socket_users[request.sid] = user_id
         
         # Join user to their personal room
         join_room(f"user_{user_id}")
@@ -105,6 +117,189 @@ def handle_typing(socketio, data):
     except Exception as e:
         print(f"Error handling typing: {e}")
 
+def socket_user_id(data):
+    """User id of this socket: from user_login, or from a token sent with the event"""
+    # Sockets that sent user_login are already authenticated
+    user_id = socket_users.get(request.sid)
+    if not user_id and data.get('token'):
+        user_id = jwt.decode(data['token'], SECRET_KEY, algorithms=['HS256'])['user_id']
+    return user_id
+
+def handle_play_move(socketio, data):
+    """Player move and AI reply over the socket, without a per-move HTTP request"""
+    try:
+        user_id = socket_user_id(data)
+        if not user_id:
+            emit('move_error', {'error': 'Not authenticated', 'requestId': data.get('request_id')})
+            return
+        
+        response, status_code = play_turn(ObjectId(user_id), data)
+        response['requestId'] = data.get('request_id')
+        if status_code == 200:
+            emit('move_result', response)
+        else:
+            response['status'] = status_code
+            emit('move_error', response)
+    except Exception as e:
+        print(f"Error in play_move: {e}")
+        emit('move_error', {'error': f'Failed to play move: {str(e)}', 'requestId': data.get('request_id')})
+
+def handle_create_game(socketio, data):
+    """Open a multiplayer game and wait in its room for an opponent"""
+    try:
+        user_id = socket_user_id(data)
+        if not user_id:
+            emit('game_error', {'error': 'Not authenticated'})
+            return
+        
+        game = multiplayer_games.create(
+            user_id, data.get('color'), data.get('base_seconds'), data.get('increment_seconds')
+        )
+        join_room(f"game_{game.game_id}")
+        emit('game_created', game.state(time.monotonic()))
+    except Exception as e:
+        print(f"Error creating game: {e}")
+        emit('game_error', {'error': f'Failed to create game: {str(e)}'})
+
+def handle_join_game(socketio, data):
+    """Take the free seat of a game, or rejoin/spectate it"""
+    try:
+        user_id = socket_user_id(data)
+        game = multiplayer_games.get(data.get('game_id'))
+        if not user_id or not game:
+            emit('game_error', {'error': 'Game not found' if user_id else 'Not authenticated', 'gameId': data.get('game_id')})
+            return
+        
+        now = time.monotonic()
+        was_waiting = game.status == 'waiting'
+        # Anyone else joining a started game watches it
+        multiplayer_games.join(game, user_id, now)
+        join_room(f"game_{game.game_id}")
+        
+        if was_waiting and game.status == 'playing':
+            socketio.emit('game_started', game.state(now), room=f"game_{game.game_id}")
+        else:
+            emit('game_state', game.state(now))
+    except Exception as e:
+        print(f"Error joining game: {e}")
+        emit('game_error', {'error': f'Failed to join game: {str(e)}'})
+
+def handle_game_move(socketio, data):
+    """Validate a multiplayer move against the server board and clocks, then broadcast it"""
+    try:
+        user_id = socket_user_id(data)
+        game = multiplayer_games.get(data.get('game_id'))
+        move = data.get('move')
+        if not user_id or not game or not move:
+            emit('move_rejected', {'gameId': data.get('game_id'), 'move': move, 'error': 'Invalid move request'})
+            return
+        
+        now = time.monotonic()
+        error = game.play(user_id, move, now)
+        if error:
+            emit('move_rejected', {'gameId': game.game_id, 'move': move, 'error': error, 'state': game.state(now)})
+            if game.status == 'ended':
+                socketio.emit('game_over', game.state(now), room=f"game_{game.game_id}")
+            return
+        
+        socketio.emit('game_move', game.move_frame(move, now), room=f"game_{game.game_id}")
+        if game.status == 'ended':
+            socketio.emit('game_over', game.state(now), room=f"game_{game.game_id}")
+    except Exception as e:
+        print(f"Error in game_move: {e}")
+        emit('move_rejected', {'gameId': data.get('game_id'), 'error': f'Failed to play move: {str(e)}'})
+
+def handle_resign(socketio, data):
+    """Resign a multiplayer game"""
+    try:
+        user_id = socket_user_id(data)
+        game = multiplayer_games.get(data.get('game_id'))
+        if not user_id or not game:
+            emit('game_error', {'error': 'Game not found', 'gameId': data.get('game_id')})
+            return
+        
+        error = game.resign(user_id)
+        if error:
+            emit('game_error', {'error': error, 'gameId': game.game_id})
+            return
+        socketio.emit('game_over', game.state(time.monotonic()), room=f"game_{game.game_id}")
+    except Exception as e:
+        print(f"Error resigning game: {e}")
+        emit('game_error', {'error': f'Failed to resign: {str(e)}'})
+
+def player_rating(user_id):
+    """Current rating from the user's profile"""
+    profile = profiles_collection.find_one({'user_id': ObjectId(user_id)}, {'stats.rating': 1})
+    return (profile or {}).get('stats', {}).get('rating', 1200)
+
+def start_match(socketio, entry, opponent):
+    """Open a game for two matched players and tell both through their user rooms"""
+    now = time.monotonic()
+    base_seconds, increment_seconds = entry.time_control
+    game = multiplayer_games.create(opponent.user_id, None, base_seconds, increment_seconds)
+    multiplayer_games.join(game, entry.user_id, now)
+    state = game.state(now)
+    for player in (entry, opponent):
+        socketio.emit('match_found', state, room=f"user_{player.user_id}")
+
+def handle_join_queue(socketio, data):
+    """Queue for a game at a time control, or get matched straight away"""
+    try:
+        user_id = socket_user_id(data)
+        if not user_id:
+            emit('queue_error', {'error': 'Not authenticated'})
+            return
+        
+        # match_found goes to the user's room (also joined on user_login)
+        join_room(f"user_{user_id}")
+        control = time_control(data.get('base_seconds'), data.get('increment_seconds'))
+        match = matchmaking_queue.add(user_id, player_rating(user_id), control, time.monotonic())
+        if match:
+            start_match(socketio, *match)
+            return
+        emit('queue_joined', {'baseSeconds': control[0], 'incrementSeconds': control[1]})
+    except Exception as e:
+        print(f"Error joining queue: {e}")
+        emit('queue_error', {'error': f'Failed to join queue: {str(e)}'})
+
+def handle_leave_queue(socketio, data):
+    """Leave the matchmaking queue"""
+    user_id = socket_user_id(data or {})
+    emit('queue_left', {'queued': bool(user_id and matchmaking_queue.remove(user_id))})
+
+def run_matchmaking(socketio):
+    """Re-match queued players as their rating windows widen"""
+    while True:
+        socketio.sleep(MATCHMAKING_SWEEP_INTERVAL)
+        try:
+            for entry, opponent in matchmaking_queue.sweep(time.monotonic()):
+                start_match(socketio, entry, opponent)
+        except Exception as e:
+            print(f"Error matching players: {e}")
+
+def run_multiplayer_clocks(socketio):
+    """End games on time and broadcast the result"""
+    while True:
+        try:
+            now = time.monotonic()
+            for game in multiplayer_games.check_clocks(now):
+                socketio.emit('game_over', game.state(now), room=f"game_{game.game_id}")
+        except Exception as e:
+            print(f"Error checking game clocks: {e}")
+        socketio.sleep(MULTIPLAYER_CLOCK_INTERVAL)
+
+def run_multiplayer_flush(socketio):
+    """Write multiplayer moves to the database in batches"""
+    while True:
+        socketio.sleep(MULTIPLAYER_FLUSH_INTERVAL)
+        multiplayer_games.flush()
+
+def start_multiplayer_tasks(socketio):
+    """Start the clock, persistence and matchmaking loops for multiplayer games"""
+    socketio.start_background_task(run_multiplayer_clocks, socketio)
+    socketio.start_background_task(run_multiplayer_flush, socketio)
+    socketio.start_background_task(run_matchmaking, socketio)
+
 def emit_new_message(socketio, room_id, message_data):
     """Emit new message to chat room"""
     try: